@@ -1 +1 @@
-__all__ = ["macrocomplex_builder","macrocomplex_functions"]
\ No newline at end of file
+__all__ = ["macrocomplex_builder","macrocomplex_functions","macrocomplex_benchmark","macrocomplex_batch"]
\ No newline at end of file
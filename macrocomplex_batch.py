@@ -0,0 +1,251 @@
+import sys
+import os
+import argparse
+import timeit
+import logging
+import itertools
+import concurrent.futures
+import macrocomplex_functions
+
+batch_state = {}		#state of each process of the batch: the input files and the parsed structures of every input folder
+
+def Batch_initializer(inputs):
+	"""This function initializes a process of the batch with the input files and the parsed structures of every input folder, which are shared by all
+	the jobs of the folder instead of being parsed again by each one"""
+	batch_state["inputs"] = inputs
+
+def Batch_job(command_arguments):
+	"""This function builds the complex of a job of the batch with the inputs of its folder, see Macrocomplex_job
+
+	Arguments:
+
+	command_arguments(argparse object): the arguments of the job, see Jobs_creator
+
+	Returns:
+
+	summary (dict): contains the number of chains of the final complex ("chains"), the path of the output file ("output") and the seconds the job took ("time")
+
+	"""
+	files, structures = batch_state["inputs"][command_arguments.indir]
+	result = macrocomplex_functions.Macrocomplex_job(command_arguments, files, structures)
+	return {"chains": len(result["macrocomplex"]), "output": result["output"], "time": result["time"]}
+
+def Jobs_creator(arguments):
+	"""This function creates a job for each combination of input folder, number of chains, RMSD threshold and clashes threshold. The output of every job is
+	saved in its own folder inside the output folder of the batch, named after the input folder and the parameters of the job
+
+	Arguments:
+
+	arguments(argparse object): the command-line arguments of the batch
+
+	Returns:
+
+	jobs (list): the arguments of every job, with the same fields as the command-line arguments of macrocomplex_builder.py, see Macrocomplex_job
+
+	"""
+	jobs = []
+	for indir, number_chains, rmsd_threshold, clashes in itertools.product(arguments.indir, arguments.number_chains, arguments.rmsd_threshold, arguments.clashes):
+		outdir = os.path.join(arguments.outdir, "%s_nc%d_rmsd%g_cl%d" % (os.path.basename(indir), number_chains, rmsd_threshold, clashes))
+		jobs.append(argparse.Namespace(indir = indir, outdir = outdir, number_chains = number_chains, rmsd_threshold = rmsd_threshold, clashes = clashes,
+						cache_dir = arguments.cache_dir, batch = arguments.batch, symmetry = arguments.symmetry, workers = arguments.workers,
+						checkpoint_interval = arguments.checkpoint_interval, resume = arguments.resume, pdb_iterations = arguments.pdb_iterations,
+						metrics = arguments.metrics, metrics_interval = arguments.metrics_interval, debug = arguments.debug, verbose = False))
+	return jobs
+
+def Batch_runner(jobs, inputs, processes = 1):
+	"""This function runs the jobs of the batch, at the same time in a pool of processes if processes is greater than 1, or one after another in the current
+	process otherwise. A job that fails does not stop the rest
+
+	Arguments:
+
+	jobs (list): the arguments of every job, see Jobs_creator
+
+	inputs (dict): the input files and the parsed structures of every input folder, as (files, structures), see Structures_loader
+
+	processes (int): number of jobs run at the same time. By default 1
+
+	Returns:
+
+	results (dict): the summary of every job, see Batch_job, or None if it failed, by output folder
+
+	"""
+	results = {}
+	for job in jobs:
+		if not os.path.exists(job.outdir):
+			os.makedirs(job.outdir)
+	if processes > 1:		#the processes are forked with the parsed structures, they are not sent to each job
+		with concurrent.futures.ProcessPoolExecutor(max_workers = processes, initializer = Batch_initializer, initargs = (inputs, )) as pool:
+			futures = dict([(pool.submit(Batch_job, job), job) for job in jobs])
+			for future in concurrent.futures.as_completed(futures):
+				job = futures[future]
+				try:
+					results[job.outdir] = future.result()
+				except Exception as error:
+					results[job.outdir] = None
+					logging.error("The job of %s failed: %s" % (job.outdir, error))
+					continue
+				logging.info("The job of %s has built a complex of %d chains in %.2f seconds" % (job.outdir, results[job.outdir]["chains"], results[job.outdir]["time"]))
+	else:
+		Batch_initializer(inputs)
+		for job in jobs:
+			try:
+				results[job.outdir] = Batch_job(job)
+			except Exception as error:
+				results[job.outdir] = None
+				logging.error("The job of %s failed: %s" % (job.outdir, error))
+				continue
+			logging.info("The job of %s has built a complex of %d chains in %.2f seconds" % (job.outdir, results[job.outdir]["chains"], results[job.outdir]["time"]))
+	return results
+
+if __name__ == "__main__":
+	start = timeit.default_timer()
+
+	parser = argparse.ArgumentParser(description = "This program builds several macrocomplexes at once, as macrocomplex_builder.py does for one: a complex for each combination of the given input folders and parameters. The input files of each folder are parsed only once and shared by all its jobs.")
+
+	requiredNamed = parser.add_argument_group('required arguments')
+
+	requiredNamed.add_argument('-i', '--indir',			#INPUT FOLDERS argument
+								dest = "indir",
+								action = "store",
+								nargs = "+",
+								required = True,
+								help = "Input folders (or paths) containing all PDB files with the protein binary interactions. It is a required argument.")
+
+	parser.add_argument('-o', '--outdir',			#OUTPUT FOLDER argument
+						dest = "outdir",
+						action = "store",
+						default = "batch_output",
+						help = "Folder where the output folder of every job and the log of the batch are saved. The output folder of a job is named after its input folder and parameters, e.g. 5oom_nc53_rmsd0.3_cl30. By default, batch_output.")
+
+	parser.add_argument('-nc', '--number_chains',		#NUMBER OF CHAINS argument
+						dest = "number_chains",
+						action = "store",
+						nargs = "+",
+						type = int,
+						default = [100],
+						help = "Numbers of chains desired for the target complexes. By default, 100.")
+
+	parser.add_argument('-rmsd', '--rmsd_threshold',		#RMSD THRESHOLD argument
+						dest = "rmsd_threshold",
+						action = "store",
+						nargs = "+",
+						type = float,
+						default = [0.3],
+						help = "RMSD thresholds for considering a superimposition as correct. By default, 0.3.")
+
+	parser.add_argument('-cl', '--clashes_threshold',		#CLASHES argument
+						dest = "clashes",
+						action = "store",
+						nargs = "+",
+						type = int,
+						default = [30],
+						help = "Thresholds of the number of clashes. By default, 30.")
+
+	parser.add_argument('-j', '--jobs',		#JOBS argument
+						dest = "jobs",
+						action = "store",
+						default = 1,
+						type = int,
+						help = "Number of jobs run at the same time, each one in its own process. By default, 1, the jobs are run one after another.")
+
+	parser.add_argument('-v', '--verbose',			#VERBOSE argument
+						dest = "verbose",
+						action = "store_true",
+						default = False,
+						help = "If set, the log of the batch is also printed in standard output. The log of each job is only saved in its output folder.")
+
+	parser.add_argument('-d', '--debug',			#DEBUG argument
+						dest = "debug",
+						action = "store_true",
+						default = False,
+						help = "As in macrocomplex_builder.py, for every job.")
+
+	parser.add_argument('-m', '--metrics',			#METRICS argument
+						dest = "metrics",
+						action = "store_true",
+						default = False,
+						help = "As in macrocomplex_builder.py, for every job.")
+
+	parser.add_argument('-mi', '--metrics_interval',		#METRICS INTERVAL argument
+						dest = "metrics_interval",
+						action = "store",
+						default = 0,
+						type = int,
+						help = "As in macrocomplex_builder.py, for every job. By default, 0.")
+
+	parser.add_argument('-pi', '--pdb_iterations',		#PDB FILES ITERATIONS argument
+						dest = "pdb_iterations",
+						action = "store_true",
+						default = False,
+						help = "As in macrocomplex_builder.py, for every job.")
+
+	parser.add_argument('-c', '--cache_dir',		#CACHE FOLDER argument
+						dest = "cache_dir",
+						action = "store",
+						default = None,
+						help = "As in macrocomplex_builder.py, the parsed input files are stored in this folder and reused in later batches.")
+
+	parser.add_argument('-b', '--batch',		#BATCH argument
+						dest = "batch",
+						action = "store_true",
+						default = False,
+						help = "As in macrocomplex_builder.py, for every job.")
+
+	parser.add_argument('-s', '--symmetry',		#SYMMETRY argument
+						dest = "symmetry",
+						action = "store_true",
+						default = False,
+						help = "As in macrocomplex_builder.py, for every job.")
+
+	parser.add_argument('-w', '--workers',		#WORKERS argument
+						dest = "workers",
+						action = "store",
+						default = 1,
+						type = int,
+						help = "As in macrocomplex_builder.py, number of worker processes of every job. By default, 1.")
+
+	parser.add_argument('-ck', '--checkpoint_interval',		#CHECKPOINT INTERVAL argument
+						dest = "checkpoint_interval",
+						action = "store",
+						default = 10,
+						type = int,
+						help = "As in macrocomplex_builder.py, for every job. By default, 10.")
+
+	parser.add_argument('-r', '--resume',			#RESUME argument
+						dest = "resume",
+						action = "store_true",
+						default = False,
+						help = "As in macrocomplex_builder.py, every job is resumed from the last checkpoint saved in its output folder.")
+
+	arguments = parser.parse_args()
+	for indir in arguments.indir:
+		if not os.path.isdir(indir):
+			raise NameError("ERROR! Incorrect input folder name %s!" % indir)
+	arguments.indir = [os.path.abspath(indir) for indir in arguments.indir]
+	if len(set([os.path.basename(indir) for indir in arguments.indir])) < len(arguments.indir):
+		raise NameError("ERROR! The input folders must have different names, their jobs are saved in folders named after them!")
+	arguments.outdir = os.path.abspath(arguments.outdir)
+	if not os.path.exists(arguments.outdir):
+		os.makedirs(arguments.outdir)
+	if arguments.cache_dir != None:
+		arguments.cache_dir = os.path.abspath(arguments.cache_dir)
+
+	### Initializing the LOG system of the batch, the log of each job is saved in its output folder ###
+	logging.basicConfig(format = '%(levelname)s:%(message)s', filename = os.path.join(arguments.outdir, "macrocomplex_batch.log"), level = logging.INFO)
+	if arguments.verbose:
+		logging.getLogger().addHandler(logging.StreamHandler())
+
+	### Parsing the input files of every folder only once ###
+	inputs = {}
+	for indir in arguments.indir:
+		logging.info("Loading the input files of %s" % indir)
+		files = macrocomplex_functions.Input_files_finder(indir)
+		inputs[indir] = (files, macrocomplex_functions.Structures_loader(indir, files, arguments.cache_dir))
+
+	jobs = Jobs_creator(arguments)
+	logging.info("Running %d jobs, %d at the same time" % (len(jobs), max(1, min(arguments.jobs, len(jobs)))))
+	results = Batch_runner(jobs, inputs, arguments.jobs)
+
+	stop = timeit.default_timer()
+	logging.info("%d of %d jobs have finished successfully! The batch took %f seconds" % (len([result for result in results.values() if result is not None]), len(jobs), stop - start))
+	sys.exit(0 if all([result is not None for result in results.values()]) else 1)
@@ -0,0 +1,361 @@
+import Bio.PDB
+import sys
+import os
+import argparse
+import timeit
+import logging
+import json
+import runpy
+import resource
+import functools
+import subprocess
+import tracemalloc
+import numpy
+import macrocomplex_functions
+
+### Command-line arguments of each example, the same as in the Examples section of the README ###
+
+EXAMPLES = {
+	"6ezm": ["-nc", "24"],
+	"1g65": ["-nc", "28", "-rmsd", "0.5", "-cl", "45"],
+	"5vox": ["-nc", "33"],
+	"5oom": ["-nc", "53"],
+	"3kuy": ["-nc", "10"],
+	"5dn6": [],
+	"capsid_virus": ["-nc", "60"],
+	"mosaic_virus": ["-nc", "180", "-rmsd", "1", "-cl", "70"]
+}
+
+### Examples whose output is known to differ from the one in examples_output, only in the placement of some chains, with the largest RMSD of a chain allowed ###
+
+KNOWN_DEVIATIONS = {
+	"5dn6": (6.0, "examples_output was built before the rotations and translations of the superimpositions were composed correctly, the chains O, Q, S and T of the c-ring close it in a different way: each one is 1.1 to 5.8 A from the closest reference chain")
+}
+
+### Functions of the building process timed in each stage, see Stage_profiler.instrument ###
+
+STAGES = [
+	("parsing", macrocomplex_functions, "Structures_loader"),
+	("key_atoms", macrocomplex_functions, "Key_atom_retriever"),
+	("superimposition", macrocomplex_functions, "superimposition"),
+	("clash_search", macrocomplex_functions.SpatialIndex, "contacts"),
+	("symmetry", macrocomplex_functions.Symmetry_expander, "expand"),
+	("id_assignment", macrocomplex_functions.ID_allocator, "allocate"),
+	("output", macrocomplex_functions, "Complex_writer")
+]
+
+class Stage_profiler(object):
+	"""This class measures the time spent in each stage of the building process, and optionally the peak memory allocated while running it. The time of
+	a stage does not include the time of the stages called from it (e.g. key_atoms is called while parsing), so the times of all the stages and the rest
+	of the program ("other") add up to the total time. The peak memory of a stage is the largest amount of memory allocated while running it on top of the
+memory already allocated when it started, and includes the stages called from it
+
+	Arguments:
+
+	memory (boolean): if True, the memory allocations are traced with tracemalloc, which makes the program several times slower. By default False
+
+	"""
+	def __init__(self, memory = False):
+		self.memory = memory
+		self.stages = {}			#time, number of calls and peak memory of each stage
+		self.counters = {"superimpositions": 0, "neighbour_queries": 0, "query_atoms": 0}
+		self.stack = []				#stages being run, the innermost one at the end
+		self.originals = []			#functions replaced by instrument, restored by restore
+
+	def enter(self, stage):
+		"""Starts timing a stage, pausing the stage that called it"""
+		now = timeit.default_timer()
+		current = 0
+		if self.stack:
+			self.stages[self.stack[-1][0]]["time"] += now - self.stack[-1][1]
+			if self.memory:
+				self.stack[-1][2] = max(self.stack[-1][2], tracemalloc.get_traced_memory()[1])
+		if self.memory:
+			current = tracemalloc.get_traced_memory()[0]		#the memory allocated before the stage is not part of its peak
+			tracemalloc.reset_peak()
+		self.stages.setdefault(stage, {"time": 0.0, "calls": 0, "peak_memory": 0})["calls"] += 1
+		self.stack.append([stage, now, 0, current])
+
+	def exit(self):
+		"""Stops timing the current stage, resuming the stage that called it"""
+		now = timeit.default_timer()
+		stage, started, peak, current = self.stack.pop()
+		self.stages[stage]["time"] += now - started
+		if self.memory:
+			peak = max(peak, tracemalloc.get_traced_memory()[1])
+			self.stages[stage]["peak_memory"] = max(self.stages[stage]["peak_memory"], peak - current)
+			tracemalloc.reset_peak()
+			if self.stack:		#the calling stage was also running while this peak was reached
+				self.stack[-1][2] = max(self.stack[-1][2], peak)
+		if self.stack:
+			self.stack[-1][1] = now
+
+	def wrap(self, function, stage):
+		"""Returns the function timed as the given stage"""
+		@functools.wraps(function)
+		def wrapper(*args, **kwargs):
+			self.enter(stage)
+			try:
+				return function(*args, **kwargs)
+			finally:
+				self.exit()
+		return wrapper
+
+	def instrument(self):
+		"""Replaces the functions of every stage (see STAGES) by their timed version, and counts the superimpositions and the neighbour queries"""
+		for stage, owner, name in STAGES:
+			self.originals.append((owner, name, getattr(owner, name)))
+			setattr(owner, name, self.wrap(getattr(owner, name), stage))
+		kabsch_superimposer = macrocomplex_functions.Kabsch_superimposer
+		contacts = macrocomplex_functions.SpatialIndex.contacts
+		def counted_superimposer(ref_coords, sample_coords):
+			self.counters["superimpositions"] += len(ref_coords)		#one superimposition for each reference chain
+			return kabsch_superimposer(ref_coords, sample_coords)
+		def counted_contacts(spatial_index, coords, groups = None):
+			self.counters["neighbour_queries"] += 1
+			self.counters["query_atoms"] += len(coords)
+			return contacts(spatial_index, coords, groups)
+		self.originals += [(macrocomplex_functions, "Kabsch_superimposer", kabsch_superimposer), (macrocomplex_functions.SpatialIndex, "contacts", contacts)]
+		macrocomplex_functions.Kabsch_superimposer = counted_superimposer
+		macrocomplex_functions.SpatialIndex.contacts = counted_contacts
+
+	def restore(self):
+		"""Puts back the original functions replaced by instrument"""
+		for owner, name, function in reversed(self.originals):
+			setattr(owner, name, function)
+		self.originals = []
+
+def Example_runner(indir, outdir, arguments, memory = False):
+	"""This function runs macrocomplex_builder.py on an example in the current process, with its functions instrumented, see Stage_profiler. As the memory
+	of the process is measured too, it should be called once per process, see Benchmark
+
+	Arguments:
+
+	indir (str): the input directory of the example
+
+	outdir (str): the output directory of the example
+
+	arguments (list): the rest of command-line arguments of the builder, see EXAMPLES
+
+	memory (boolean): if True, the peak memory of each stage is also measured, see Stage_profiler. By default False
+
+	Returns:
+
+	profile (dict): contains the total time ("time"), the maximum resident memory of the process ("max_rss", in bytes), the time, calls and peak
+	memory of each stage ("stages"), the time not spent in any stage ("other") and the counters of superimpositions and neighbour queries ("counters")
+
+	"""
+	profiler = Stage_profiler(memory)
+	profiler.instrument()
+	sys.argv = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "macrocomplex_builder.py"), "-i", indir, "-o", outdir] + arguments
+	if memory:
+		tracemalloc.start()
+	start = timeit.default_timer()
+	try:
+		runpy.run_path(sys.argv[0], run_name = "__main__")
+	finally:
+		total = timeit.default_timer() - start
+		if memory:
+			tracemalloc.stop()
+		profiler.restore()
+	return {"time": total, "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, "stages": profiler.stages,
+			"other": total - sum([stage["time"] for stage in profiler.stages.values()]), "counters": profiler.counters}
+
+def Structure_loader(path):
+	"""This function parses a PDB or a MMCIF file, depending on its extension"""
+	if path.endswith(".cif"):
+		return Bio.PDB.MMCIFParser(QUIET = True).get_structure("structure", path)
+	return Bio.PDB.PDBParser(QUIET = True).get_structure("structure", path)
+
+def Output_checker(outdir, reference_dir, expected_chains = None):
+	"""This function compares the complex built in an output directory with the one in examples_output. The chains of the complex are paired with the chains
+	of the reference with the same number of key atoms (CA/C4'), the closest pairs first, and the chains left without a pair are compared with the closest
+	reference chain with their number of key atoms. As both complexes are built on the first input file, they share the same frame and no superimposition
+	is needed
+
+	Arguments:
+
+	outdir (str): the output directory of the example, with macrocomplex.pdb or macrocomplex.cif
+
+	reference_dir (str): the output directory of the example in examples_output. It may only contain the log file, then only the number of chains is checked
+
+	expected_chains (int): number of chains expected if the reference does not have the final complex nor its number of chains. By default None
+
+	Returns:
+
+	check (dict): contains the number of chains of the complex ("chains"), the expected number of chains ("expected_chains"), the number of chains paired
+	with the reference ("paired_chains"), the RMSD of all the paired key atoms ("rmsd") and the largest RMSD of a pair of chains ("max_rmsd")
+
+	"""
+	outputs = [os.path.join(outdir, name) for name in ("macrocomplex.pdb", "macrocomplex.cif") if os.path.exists(os.path.join(outdir, name))]
+	references = [os.path.join(reference_dir, name) for name in ("macrocomplex.pdb", "macrocomplex.cif") if os.path.exists(os.path.join(reference_dir, name))]
+	check = {"chains": None, "expected_chains": expected_chains, "paired_chains": None, "rmsd": None, "max_rmsd": None}
+	if not outputs:
+		return check
+	complex_chains = [numpy.array([atom.coord for atom in macrocomplex_functions.Key_atom_retriever(chain)[0]]) for chain in Structure_loader(outputs[0])[0]]
+	check["chains"] = len(complex_chains)
+	## Number of chains of the reference, from its structure or from the last line of its log ##
+	if references:
+		reference_chains = [numpy.array([atom.coord for atom in macrocomplex_functions.Key_atom_retriever(chain)[0]]) for chain in Structure_loader(references[0])[0]]
+		check["expected_chains"] = len(reference_chains)
+	else:
+		reference_chains = []
+		if os.path.exists(os.path.join(reference_dir, "macrocomplex.log")):
+			with open(os.path.join(reference_dir, "macrocomplex.log"), errors = "replace") as log:
+				for line in log:
+					if "The final complex has" in line:
+						check["expected_chains"] = int(line.split("has")[1].split()[0])
+	if not reference_chains:
+		return check
+	## Pairs the chains with the reference chains of the same length, the closest pairs first, so the order of the chains does not matter ##
+	distances = sorted([(float(numpy.sqrt(((coords - reference) ** 2).sum(axis = 1).mean())), i, j) for i, coords in enumerate(complex_chains)
+				for j, reference in enumerate(reference_chains) if len(reference) == len(coords)])
+	pairs = {}
+	used = set()
+	for rmsd, i, j in distances:
+		if i not in pairs and j not in used:
+			pairs[i] = j
+			used.add(j)
+	check["paired_chains"] = len(pairs)
+	for rmsd, i, j in distances:		#the chains without a pair, e.g. a chain of another input file in the reference, are compared with the closest one
+		if i not in pairs:
+			pairs[i] = j
+	squared_distances = []
+	chain_rmsds = []
+	for i, j in pairs.items():
+		squared_distances.append(((complex_chains[i] - reference_chains[j]) ** 2).sum(axis = 1))
+		chain_rmsds.append(numpy.sqrt(squared_distances[-1].mean()))
+	if chain_rmsds:
+		check["rmsd"] = float(numpy.sqrt(numpy.concatenate(squared_distances).mean()))
+		check["max_rmsd"] = float(max(chain_rmsds))
+	return check
+
+def Benchmark(examples, examples_dir, reference_dir, outdir, memory = False, rmsd_tolerance = 1.0, extra_arguments = []):
+	"""This function runs the benchmark of every example in a new process (see Example_runner), checks its output (see Output_checker) and logs a summary
+
+	Arguments:
+
+	examples (list): names of the examples to run, see EXAMPLES
+
+	examples_dir (str): the folder containing the input folders of the examples
+
+	reference_dir (str): the folder containing the outputs of the examples, as <example>_output
+
+	outdir (str): the folder where the outputs of the examples are saved
+
+	memory (boolean): if True, the peak memory of each stage is also measured. By default False
+
+	rmsd_tolerance (float): largest RMSD of a pair of chains for the output of an example to be considered correct. By default 1.0
+
+	extra_arguments (list): command-line arguments of the builder added to the ones of every example. By default none
+
+	Returns:
+
+	results (dict): contains the profile (see Example_runner), the check (see Output_checker), whether the output is correct ("correct") and the known
+	deviation from the reference, if it is only correct because of it ("deviation"), of each example. An example with a known deviation (see KNOWN_DEVIATIONS)
+	is correct if it has the expected number of chains and the largest RMSD of a chain is below the one allowed for it, instead of rmsd_tolerance
+
+	"""
+	results = {}
+	for example in examples:
+		example_outdir = os.path.join(outdir, example)
+		profile_path = os.path.join(outdir, example + "_profile.json")
+		command = [sys.executable, os.path.abspath(__file__), "--run", example, "-e", examples_dir, "-o", outdir, "--arguments=" + " ".join(extra_arguments)] + (["-m"] if memory else [])
+		logging.info("Running example %s" % example)
+		process = subprocess.run(command, stdout = subprocess.DEVNULL)
+		if process.returncode != 0 or not os.path.exists(profile_path):
+			logging.error("Example %s failed with exit code %d" % (example, process.returncode))
+			results[example] = {"profile": None, "check": None, "correct": False, "deviation": None}
+			continue
+		with open(profile_path) as fh:
+			profile = json.load(fh)
+		expected_chains = int(EXAMPLES[example][EXAMPLES[example].index("-nc") + 1]) if "-nc" in EXAMPLES.get(example, []) else None
+		check = Output_checker(example_outdir, os.path.join(reference_dir, example + "_output"), expected_chains)
+		chains_correct = check["chains"] is not None and check["chains"] == check["expected_chains"]
+		correct = chains_correct and (check["max_rmsd"] is None or check["max_rmsd"] <= rmsd_tolerance)
+		deviation = None
+		if chains_correct and not correct and example in KNOWN_DEVIATIONS:		#the placement of some chains is known to differ from the reference, up to a bound
+			allowed_rmsd, deviation = KNOWN_DEVIATIONS[example]
+			correct = check["max_rmsd"] <= allowed_rmsd
+		results[example] = {"profile": profile, "check": check, "correct": correct, "deviation": deviation}
+		## Summary of the example ##
+		logging.info("%s: %.2f s, %.1f MB, %s chains (expected %s), RMSD %s, %s" % (example, profile["time"], profile["max_rss"] / 2.0 ** 20, check["chains"], check["expected_chains"],
+					"%.3f" % check["rmsd"] if check["rmsd"] is not None else "-", "WRONG" if not correct else "correct (known deviation, max RMSD %.3f)" % check["max_rmsd"] if deviation else "correct"))
+		if deviation:
+			logging.info("    known deviation, up to %.1f A: %s" % (KNOWN_DEVIATIONS[example][0], deviation))
+		for stage, stats in sorted(profile["stages"].items(), key = lambda item: -item[1]["time"]):
+			logging.info("    %-16s %9.3f s %8d calls%s" % (stage, stats["time"], stats["calls"], "  peak %.1f MB" % (stats["peak_memory"] / 2.0 ** 20) if memory else ""))
+		logging.info("    %-16s %9.3f s" % ("other", profile["other"]))
+		logging.info("    %d superimpositions, %d neighbour queries of %d atoms" % (profile["counters"]["superimpositions"], profile["counters"]["neighbour_queries"], profile["counters"]["query_atoms"]))
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description = "This program runs macrocomplex_builder.py on the bundled examples, reporting the time and memory of each stage of the building process and checking the built complexes against examples_output.")
+
+	parser.add_argument('examples',		#EXAMPLES argument
+						nargs = "*",
+						help = "Names of the examples to run. By default, all the folders of the examples directory that have known arguments.")
+
+	parser.add_argument('-e', '--examples_dir',		#EXAMPLES FOLDER argument
+						dest = "examples_dir",
+						action = "store",
+						default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples"),
+						help = "Folder containing the input folders of the examples. By default, the examples folder of the package.")
+
+	parser.add_argument('-r', '--reference_dir',		#REFERENCE FOLDER argument
+						dest = "reference_dir",
+						action = "store",
+						default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples_output"),
+						help = "Folder containing the reference outputs of the examples. By default, the examples_output folder of the package.")
+
+	parser.add_argument('-o', '--outdir',		#OUTPUT FOLDER argument
+						dest = "outdir",
+						action = "store",
+						default = "benchmark_output",
+						help = "Folder where the outputs of the examples and the results of the benchmark are saved. By default, benchmark_output.")
+
+	parser.add_argument('-m', '--memory',		#MEMORY argument
+						dest = "memory",
+						action = "store_true",
+						default = False,
+						help = "If set, the peak memory of each stage is measured with tracemalloc. It makes the examples several times slower.")
+
+	parser.add_argument('-t', '--rmsd_tolerance',		#RMSD TOLERANCE argument
+						dest = "rmsd_tolerance",
+						action = "store",
+						default = 1.0,
+						type = float,
+						help = "Largest RMSD (in angstroms) between a chain and the reference for an example to be considered correct. By default, 1.0.")
+
+	parser.add_argument('-a', '--arguments',		#BUILDER ARGUMENTS argument
+						dest = "arguments",
+						action = "store",
+						default = "",
+						help = "Command-line arguments of macrocomplex_builder.py added to the ones of every example, e.g. --arguments=\"-b -w 4\". By default, none.")
+
+	parser.add_argument('--run',		#used internally to run a single example in a new process
+						dest = "run",
+						action = "store",
+						default = None,
+						help = argparse.SUPPRESS)
+
+	arguments = parser.parse_args()
+	extra_arguments = arguments.arguments.split()
+	outdir = os.path.abspath(arguments.outdir)
+	if not os.path.exists(outdir):
+		os.makedirs(outdir)
+
+	### Runs a single example, in the process started by Benchmark ###
+	if arguments.run is not None:
+		profile = Example_runner(os.path.join(os.path.abspath(arguments.examples_dir), arguments.run), os.path.join(outdir, arguments.run), EXAMPLES.get(arguments.run, []) + extra_arguments, arguments.memory)
+		with open(os.path.join(outdir, arguments.run + "_profile.json"), "w") as fh:
+			json.dump(profile, fh, indent = 1)
+		sys.exit(0)
+
+	logging.basicConfig(level = logging.INFO, format = "%(message)s", handlers = [logging.FileHandler(os.path.join(outdir, "benchmark.log"), mode = "w"), logging.StreamHandler()])
+	examples = arguments.examples or [example for example in sorted(os.listdir(arguments.examples_dir)) if example in EXAMPLES]
+	results = Benchmark(examples, os.path.abspath(arguments.examples_dir), os.path.abspath(arguments.reference_dir), outdir, arguments.memory, arguments.rmsd_tolerance, extra_arguments)
+	with open(os.path.join(outdir, "benchmark.json"), "w") as fh:
+		json.dump(results, fh, indent = 1)
+	logging.info("Results saved in %s" % os.path.join(outdir, "benchmark.json"))
+	sys.exit(0 if all([result["correct"] for result in results.values()]) else 1)
@@ -6,6 +6,38 @@ import argparse
 import timeit
 import logging
 import re
+import hashlib
+import json
+import queue
+import threading
+import collections
+import itertools
+import io
+import tempfile
+import contextvars
+import concurrent.futures
+import multiprocessing.shared_memory
+import numpy
+
+class Job_logger(logging.LoggerAdapter):
+	"""This class is the log of the building process. Its messages are sent to the logger of the job running in the current thread (see Macrocomplex_job)
+	or worker process (see Worker_initializer), or to the "macrocomplex" logger outside of them, so several jobs can run at the same time in different
+	threads of a program, each one with its own log"""
+
+	current = contextvars.ContextVar("macrocomplex_logger", default = logging.getLogger("macrocomplex"))		#every thread starts with the default one
+
+	def __init__(self):
+		logging.LoggerAdapter.__init__(self, None, {})
+
+	@property
+	def logger(self):
+		return self.current.get()
+
+	@logger.setter
+	def logger(self, value):		#the logger is only set through current
+		pass
+
+logger = Job_logger()		#the log of the building process, see Job_logger
 
 def Key_atom_retriever(chain):
 	"""This function retrieves the key atom, CA in case of proteins and C4' in case of nucleic acids, to do the superimposition and also returns a
@@ -33,7 +65,7 @@ def Key_atom_retriever(chain):
 		## Appends the CA atoms and sets the molecule type of protein ##
 		if res.get_id()[0] == " " and res_name not in nucleic_acids:		#checks whether the residue is not a HETATM or nucleic acid
 			if 'CA' not in res:		#checks whether the residue has CA atoms
-				logging.warning("This protein residue %d %s does not have CA atom" % (res.get_id()[1], res_name))
+				logger.warning("This protein residue %d %s does not have CA atom" % (res.get_id()[1], res_name))
 			else:
 				atoms.append(res['CA'])		#append CA atoms to the list of sample atoms
 				molecule = 'PROTEIN'		#set the molecule type to protein
@@ -46,120 +78,1652 @@ def Key_atom_retriever(chain):
 			atoms.append(res['C4\''])	#append C4' atoms to the list of atoms
 	return(atoms, molecule)		# Return all key atoms list and the type of molecule to which they belong
 
-def ID_creator(IDs, ID):
-	"""This function returns an ID for the new chain to be added to the complex. It generates a single character ID for the first
-	62 IDs, being all the uppercase, lowercase letters and digits, i.e., 26 + 26 + 10 = 62. Then, it generates two-character IDs,
-	by combining all the uppercase letters, generating up to 26**2 IDs, which is 676 new IDs. This is a total of 738 chain IDs. It
-	also needs a list with all the chain IDs, so it does not return an ID already present in the list of chain IDs already in the complex
+def Chain_indexer(chain):
+	"""This function computes, only once, all the information of a chain needed to superimpose it or to look for clashes with it: its key atoms, an
+	array with their coordinates, its molecule type and a fingerprint of its sequence. Two chains can only be superimposed if they have the same
+	fingerprint, which already implies having the same molecule type and the same number of key atoms. It also computes the radius of gyration of the
+	key atoms, which does not change when the chain is rotated or translated
 
 	Arguments:
 
-	IDs (list): a list containing the IDs of all chains present in the building complex
+	chain (Bio.PDB.Chain.Chain): an instance of class chain
+
+	Returns:
+
+	index (dict): contains the array of the coordinates of the key atoms ("coords"), the molecule type ("molecule"), the hash of the molecule type and
+	sequence of the key atoms residues ("fingerprint") and the radius of gyration of the key atoms ("gyration"), see Gyration_radius
+
+	"""
+	atoms, molecule = Key_atom_retriever(chain)		#retrieves all key atoms (CA or C4') and molecule type of the chain
+	sequence = "-".join([atom.get_parent().get_resname().strip() for atom in atoms])
+	fingerprint = hashlib.sha1((molecule + ":" + sequence).encode()).hexdigest()
+	coords = numpy.array([atom.coord for atom in atoms], dtype = float)
+	return {"coords": coords, "molecule": molecule, "fingerprint": fingerprint, "gyration": Gyration_radius(coords)}
+
+def Gyration_radius(coords):
+	"""This function returns the radius of gyration of a set of atoms, the root mean square distance of the atoms to their centroid. The RMSD of the
+	superimposition of two chains is never smaller than the difference of their radii of gyration"""
+	if not len(coords):
+		return 0.0
+	return float(numpy.sqrt(((coords - coords.mean(axis = 0)) ** 2).sum(axis = 1).mean()))
 
-	ID (string): the ID that the chain has by default, i.e., the ID it has on the PDB file
+def Unpacked_atoms(chain):
+	"""This function returns all the atoms of a chain in the order Bio.PDB.PDBIO writes them, with every alternate location of the disordered atoms and
+	residues, which are all written in the complex"""
+	return [atom for residue in chain.get_unpacked_list() for atom in residue.get_unpacked_list()]
+
+def Structure_summarizer(structure):
+	"""This function extracts from a parsed structure all the data the building process needs, as arrays that can be saved in a NPZ file: the pristine
+	coordinates of all the atoms of its first model, with all their alternate locations (see Unpacked_atoms) ("coords"), the ID ("chain_ids") and the start and end positions of the atoms ("chain_ranges") of
+	each chain, and the index of each chain (see Chain_indexer): the coordinates of all the key atoms ("key_coords"), the start and end positions of the
+	key atoms of each chain ("key_ranges"), and the molecule type ("molecules"), fingerprint ("fingerprints") and radius of gyration ("gyrations") of each chain
+
+	Arguments:
+
+	structure (Bio.PDB.Structure): the parsed structure
 
 	Returns:
 
-	ID (string): the new ID that is not present in the list of IDs
+	summary (dict): the arrays described above
 
 	"""
-	UP = list(string.ascii_uppercase)	
-	LOW = list(string.ascii_lowercase)
-	DIG = list(string.digits)
-	alphabet = UP + LOW + DIG		#creates an alphabet containing all the possible characters that can be used as chain IDs
+	chain_ids, chain_ranges, key_coords, key_ranges, molecules, fingerprints, gyrations = [], [], [], [], [], [], []
+	coords = []
+	start = key_start = 0
+	for chain in structure[0]:
+		index = Chain_indexer(chain)
+		atoms = Unpacked_atoms(chain)
+		coords += [atom.coord for atom in atoms]
+		end = start + len(atoms)
+		chain_ids.append(chain.id)
+		chain_ranges.append((start, end))
+		key_coords.append(index["coords"].reshape(-1, 3))
+		key_ranges.append((key_start, key_start + len(index["coords"])))
+		molecules.append(index["molecule"])
+		fingerprints.append(index["fingerprint"])
+		gyrations.append(index["gyration"])
+		start, key_start = end, key_start + len(index["coords"])
+	return {"coords": numpy.array(coords, dtype = numpy.float32).reshape(-1, 3), "chain_ids": numpy.array(chain_ids),
+			"chain_ranges": numpy.array(chain_ranges, dtype = int).reshape(-1, 2), "key_coords": numpy.concatenate(key_coords) if key_coords else numpy.empty((0, 3)),
+			"key_ranges": numpy.array(key_ranges, dtype = int).reshape(-1, 2), "molecules": numpy.array(molecules), "fingerprints": numpy.array(fingerprints),
+			"gyrations": numpy.array(gyrations, dtype = float)}
 
-	if len(IDs) < 62:				#checks if the length of the lsit containing the IDs of all chains in the complex is smaller than 62
-		if ID not in IDs:			#checks if the ID by default of the chain is present on the IDs list
-			return ID
-		elif ID in IDs:				#checks if the ID by default is indeed on the list	
-			for i in range(0, len(alphabet)):		#loops through all the characters on the alphabet
-				if alphabet[i] not in IDs:			#checks if that character is not already taken as an ID
-					return alphabet[i]
-				else:								#if it is already an ID, keeps looping through the alphabet
-					continue
-	elif len(IDs) >= 62:			#checks if the length of the lsit containing the IDs of all chains in the complex is greater than 62
-		for char1 in alphabet:
-			for char2 in alphabet:
-				ID = char1 + char2	#creates a 2 character ID by combining two uppercase letters
-				if ID not in IDs:	#checks if new ID is not on the list of IDs
-					return ID
-				else:				#if it is indeed on the list, keeps loopting
-					continue
+def Structure_parser(file_path, cache_dir = None):
+	"""This function parses a PDB file and keeps the pristine coordinates of all its atoms and the index of each chain, see Structure_summarizer. If a cache
+	directory is provided, these arrays are saved in it in a NPZ file, keyed by the SHA-1 hash of the file contents, and loaded from there in later runs
+	without parsing the file. The structure (topology) of a file loaded from the cache is only parsed again if its atoms have to be written, see
+	Structure_topology
 
-def superimposition(ref_structure, sample_structure, rmsd_threshold):
-	"""This function, given a reference and a sample structure does the superimposition of every combination of pairs of chains and calculates the RMSD.
-	It returns a dictionary with a tuple of the reference and sample chain as a tuple and the superimposer instance resulting from those two chains, as
-	well as two variables, the ID of the chain with the smallest RMSD when superimposing with the reference structure and the RMSD itself
+	Arguments:
+
+	file_path (str): path of the PDB file to parse
+
+	cache_dir (str): path of the directory used as on-disk cache of parsed structures. If None (default), no cache is used
+
+	Returns:
+
+	entry (dict): contains the path of the file ("path"), the cache directory ("cache_dir"), the parsed structure ("structure") and the list of its atoms (see Unpacked_atoms)
+	("atoms"), or None if they were not parsed, a read-only array with their pristine coordinates ("coords"), the start and end positions of the atoms of
+	each chain ("chains") and a list of tuples with the ID and the index of each chain ("index"), see Chain_indexer
+
+	"""
+	structure = summary = None
+	## Looks for the parsed file in the on-disk cache ##
+	if cache_dir is not None:
+		with open(file_path, "rb") as fh:
+			file_hash = hashlib.sha1(fh.read()).hexdigest()		#the cache key is the hash of the file contents, not its name
+		cache_path = os.path.join(cache_dir, file_hash + ".v2.npz")		#v2: with the coordinates of every alternate location
+		if os.path.exists(cache_path):
+			with numpy.load(cache_path, allow_pickle = False) as npz:
+				summary = dict(npz)
+	## Parses the file if it was not cached ##
+	if summary is None:
+		pdb_parser = Bio.PDB.PDBParser(QUIET = True)		#creation of PDBParser object
+		structure = pdb_parser.get_structure("sample", file_path)
+		summary = Structure_summarizer(structure)
+		if cache_dir is not None and not os.path.exists(cache_path):		#another run sharing the cache may have saved it meanwhile
+			fh = tempfile.NamedTemporaryFile(dir = cache_dir, prefix = file_hash + ".", suffix = ".tmp", delete = False)		#each run writes its own temporary file
+			try:
+				with fh:
+					numpy.savez(fh, **summary)
+				os.replace(fh.name, cache_path)		#the cached file is complete or absent, if several runs save it the last one replaces it with the same data
+			except BaseException:
+				if os.path.exists(fh.name):
+					os.remove(fh.name)
+				raise
+	coords = summary["coords"]		#pristine coordinates of all the atoms of the structure
+	coords.flags.writeable = False		#nobody must modify the pristine coordinates
+	chains = {}		#positions of the atoms of each chain in the list of atoms
+	index = []		#the index of each chain, in the same order as the chains of the structure
+	for chain_id, (start, end), (key_start, key_end), molecule, fingerprint, gyration in zip(summary["chain_ids"], summary["chain_ranges"], summary["key_ranges"],
+																						summary["molecules"], summary["fingerprints"], summary["gyrations"]):
+		chains[str(chain_id)] = (int(start), int(end))
+		index.append((str(chain_id), {"coords": summary["key_coords"][key_start:key_end], "molecule": str(molecule), "fingerprint": str(fingerprint), "gyration": float(gyration)}))
+	return {"path": file_path, "cache_dir": cache_dir, "structure": structure, "atoms": [atom for chain in structure[0] for atom in Unpacked_atoms(chain)] if structure is not None else None,
+			"coords": coords, "chains": chains, "index": index}
+
+def Structure_topology(entry):
+	"""This function returns the structure (topology) of a preloaded file, which is parsed again, only once, if the file was loaded from the cache, see
+	Structure_parser. It is only needed to write the atoms of the file
+
+	Arguments:
+
+	entry (dict): the preloaded file, as returned by Structure_parser, the structure and the list of its atoms are added to it
+
+	Returns:
+
+	structure (Bio.PDB.Structure): the parsed structure
+
+	"""
+	if entry["structure"] is None:
+		entry["structure"] = Bio.PDB.PDBParser(QUIET = True).get_structure("sample", entry["path"])
+		entry["atoms"] = [atom for chain in entry["structure"][0] for atom in Unpacked_atoms(chain)]
+		if len(entry["atoms"]) != len(entry["coords"]):
+			raise NameError("ERROR! The file %s has changed since it was loaded!" % entry["path"])
+	return entry["structure"]
+
+def Input_files_finder(indir):
+	"""This function lists the PDB files of an input directory in the order they are processed by the building process: by the digits of their names if they
+	have any, alphabetically otherwise
+
+	Arguments:
+
+	indir (str): the input directory with the binary interaction PDB files
+
+	Returns:
+
+	files (list): the names of the PDB files of the directory
+
+	"""
+	files = sorted(list(filter(lambda x: x.endswith(".pdb"), os.listdir(indir))))	#Keep the files from the directory in a list of files, but only the ones ending with .pdb
+	if re.search("\\d",files[0]):		# Checking if the files
+		files = sorted(files, key=lambda x: str("".join([i for i in x if i.isdigit()])))
+	return files
+
+def Structures_loader(indir, files_list, cache_dir = None):
+	"""This function parses every binary interaction PDB file of the input directory only once, so the building process does not have to parse the files
+	again every time they are processed
 
 	Arguments:
 
-	ref_structure (Bio.PDB.Structure): is the structure on which the macrocomplex is gonna get build on every iteration of the function
+	indir (str): the input directory containing all the pdb files
 
-	sample_structure (Bio.PDB.Structure): is the structure that is gonna be added on every iteration of the function
+	files_list (list): a list containing all the pdb files of binary interactions between the different subunits or chains that form the complex
+
+	cache_dir (str): path of the directory used as on-disk cache of parsed structures. If None (default), no cache is used
 
 	Returns:
 
-	all_superimpositions (dict): dictionary of tuples of chain identifiers as key and Superimposer instances as values
+	structures (dict): dictionary with the file names as keys and the entries returned by Structure_parser as values
+
+	"""
+	if cache_dir is not None and not os.path.exists(cache_dir):		#creates the cache directory if it does not exist yet
+		os.makedirs(cache_dir)
+	structures = {}
+	for file in files_list:
+		structures[file] = Structure_parser(os.path.join(indir, file), cache_dir)
+	logger.info("%d input files have been loaded" % len(structures))
+	return structures
+
+class ID_allocator(object):
+	"""This class gives an ID to every chain added to the complex. While the complex has less than 62 chains, a chain keeps the ID it has in its file if it
+	is free, otherwise it gets the first free single character ID, being all the uppercase, lowercase letters and digits, i.e., 26 + 26 + 10 = 62. Then,
+	it generates two-character IDs, by combining all the characters, then three-character IDs, and so on, so there is no limit in the number of chains.
+	The IDs already taken are kept in a set, and as they are never released, the next free ID of each length is found with a cursor that only moves
+	forward, so every ID is allocated in constant time
+
+	Arguments:
+
+	IDs (list): a list containing the IDs of all chains present in the building complex
+
+	"""
+	alphabet = string.ascii_uppercase + string.ascii_lowercase + string.digits		#all the possible characters that can be used as chain IDs
+
+	def __init__(self, IDs = ()):
+		self.taken = set(IDs)		#the IDs of all the chains of the complex
+		self.character = 0			#position in the alphabet of the next single character ID to try
+		self.combinations = ("".join(combination) for length in itertools.count(2) for combination in itertools.product(self.alphabet, repeat = length))
+		self.combination = next(self.combinations)		#the next combination of characters to try
+
+	def allocate(self, ID):
+		"""Returns a free ID for a chain that has the given ID in its file, which is taken from now on"""
+		if len(self.taken) < len(self.alphabet):
+			while ID in self.taken:		#the ID by default is already taken, the first free character of the alphabet is used
+				ID = self.alphabet[self.character]
+				self.character += 1
+		else:
+			while self.combination in self.taken:
+				self.combination = next(self.combinations)
+			ID = self.combination
+		self.taken.add(ID)
+		return ID
+
+def Kabsch_superimposer(ref_coords, sample_coords):
+	"""This function superimposes the key atom coordinates of one sample chain onto the key atom coordinates of several reference chains at once, by
+	means of the Kabsch algorithm vectorized with NumPy. It follows the same convention as Bio.PDB.Superimposer, so the coordinates of the sample are
+	transformed as numpy.dot(coords, rotation) + translation
+
+	Arguments:
+
+	ref_coords (numpy.array): array of shape (M, N, 3) containing the N key atom coordinates of each one of the M reference chains
+
+	sample_coords (numpy.array): array of shape (N, 3) containing the N key atom coordinates of the sample chain
+
+	Returns:
+
+	RMSDs (numpy.array): array of shape (M,) with the RMSD of the superimposition of the sample chain onto each reference chain
+
+	rotations (numpy.array): array of shape (M, 3, 3) with the ROTATION matrix of each superimposition
+
+	translations (numpy.array): array of shape (M, 3) with the TRANSLATION vector of each superimposition
+
+	"""
+	ref_coords = numpy.asarray(ref_coords, dtype = float)
+	sample_coords = numpy.asarray(sample_coords, dtype = float)
+	ref_centers = ref_coords.mean(axis = 1)			#centroid of each reference chain
+	sample_center = sample_coords.mean(axis = 0)	#centroid of the sample chain
+	correlations = numpy.einsum("ni,mnj->mij", sample_coords - sample_center, ref_coords - ref_centers[:, None, :])		#correlation matrix of each pair
+	u, d, vt = numpy.linalg.svd(correlations)		#all the correlation matrices are decomposed in a single call
+	rotations = numpy.matmul(u, vt)
+	reflections = numpy.linalg.det(rotations) < 0		#checks if we have found a reflection, then the sign of the last row of vt is changed
+	vt[reflections, 2] = -vt[reflections, 2]
+	rotations[reflections] = numpy.matmul(u[reflections], vt[reflections])
+	translations = ref_centers - numpy.dot(sample_center, rotations)
+	deviations = numpy.matmul(sample_coords, rotations) + translations[:, None, :] - ref_coords
+	RMSDs = numpy.sqrt((deviations ** 2).sum(axis = (1, 2)) / len(sample_coords))
+	return(RMSDs, rotations, translations)
+
+def superimposition(ref_chains, sample_chains, rmsd_threshold, excluded = None):
+	"""This function, given the chains of a reference and a sample structure does the superimposition of every combination of pairs of chains with the same sequence
+	and calculates the RMSD. Each sample chain is superimposed onto all the reference chains with its same fingerprint at once, see Kabsch_superimposer.
+	The pairs of chains whose radii of gyration differ more than the RMSD threshold are not superimposed, their RMSD is known to be above it.
+	It returns a list of tuples with the reference and sample chain IDs as a tuple and the RMSD, ROTATION matrix and TRANSLATION vector resulting from
+	those two chains, as well as two variables, indicating if there has been any superimposition and the smallest RMSD
+
+	Arguments:
+
+	ref_chains (list): list of tuples with the ID and the index (see Chain_indexer) of each chain of the structure on which the macrocomplex is gonna get build
+
+	sample_chains (list): list of tuples with the ID and the index of each chain of the structure that is gonna be added
+
+	rmsd_threshold (float): the RMSD threshold, superimpositions above it are not taken into account to find the best superimposition
+
+	excluded (set): set of tuples of reference and sample chain IDs that must not be superimposed, because they were already rejected. By default None
+
+	Returns:
+
+	all_superimpositions (list): list of tuples of chain identifiers and (RMSD, ROTATION, TRANSLATION) tuples, sorted by RMSD. It also contains the
+	superimpositions with an RMSD above the threshold, at the end of the list. The pairs that were not superimposed have the lower bound of their RMSD,
+	and None as ROTATION and TRANSLATION
 
 	superimposed_chains (boolean): set to True if there has been at least one superimposition, otherwise is False.
 
 	best_RMSD (float): RMSD of the best superimposition (the lowest RMSD value)
 
 	"""
-	### Saving arguments passed on to the function ###
-	ref_model = ref_structure[0]			#retrieves the first and only available model of reference structure
-	sample_model = sample_structure[0]		#retrieves the first and only available model of the sample structure 
 	### Initializing and declaring variables ###
 	best_sample_chain_ID = best_ref_chain_ID = ""
 	best_RMSD = 0					#variable for the lowest RMSD
 	prev_RMSD = True				#variable to know we are in the first combination of pairs of chains					
 	superimposed_chains = False		#variable that indicates the presence of a superimposed chain (True if there is superimposed chain)
-	all_superimpositions = {}		#start the dictionary that will contain all superimposition instances
-	### Superimposition of every combination of pairs of chains between the reference and the sample structures ###
-	## loops through all chains in the reference model ##
-	for ref_chain in ref_model:		
-		logging.info("Processing reference chain %s", ref_chain.id)
-		ref_atoms, ref_molecule = Key_atom_retriever(ref_chain)		#Retrieves all key atoms (CA or C4') and molecule type of the sample						
-		## loops through all chains in the sample model ##
-		for sample_chain in sample_model:							
-			logging.info("Processing sample chain %s", sample_chain.id)
-			sample_atoms, sample_molecule = Key_atom_retriever(sample_chain)		#Retrieves all key atoms (CA or C4') and molecule type of the sample
-			if ref_molecule != sample_molecule:				#checks that the molecular types of ref chain and sample chain are the same
-				logging.warning("Cannot superimpose. Reference chain %s is %s and sample chain %s is %s" %(ref_chain.get_id(), ref_molecule, sample_chain.get_id(), sample_molecule))
-			elif len(ref_atoms) != len(sample_atoms):		#checks that the length of ref_atoms and sample_atoms is the same
-				logging.warning("Cannot superimpose. The number of atoms of the reference chain %s is %d and the number of atoms of the sample chain %s is %d", ref_chain.get_id(), len(ref_atoms), sample_chain.get_id(), len(sample_atoms))
-			## Make the superimposition between reference and sample chain ##
-			else:		#everything is fine, same type of molecule, same length of atom lists
-				super_imposer = Bio.PDB.Superimposer()				#creates superimposer instance
-				super_imposer.set_atoms(ref_atoms, sample_atoms)	#creates ROTATION and TRANSLATION matrices from lists of atoms to align
-				RMSD = super_imposer.rms 							#retrieves RMSD
-				if RMSD > rmsd_threshold:
-					logging.info("The RMSD between chain %s of the reference and chain %s of the sample is %f", ref_chain.id, sample_chain.id, RMSD)
-					continue
-				if prev_RMSD is True or RMSD < prev_RMSD:			#checks that the RMSD of this combination is smaller than the previous one
-					best_sample_chain_ID = sample_chain.id 		
-					best_ref_chain_ID = ref_chain.id 				#with this condition, the superimposer instance and other important
-					best_RMSD = RMSD 								#information pertaining to the superimposition with the smallest
-					prev_RMSD = RMSD 								#RMSD will be saved
-				all_superimpositions[(ref_chain.id, sample_chain.id)] = super_imposer		#saving ALL superimposer instances in a dictionary
-				superimposed_chains = True 							# The superimposition has been made
-				logging.info("The RMSD between chain %s of the reference and chain %s of the sample is %f", ref_chain.id, sample_chain.id, RMSD)
+	all_superimpositions = {}		#start the dictionary that will contain all superimpositions
+	### Groups the reference chains by their sequence fingerprint ###
+	buckets = {}
+	for ref_chain_id, ref_index in ref_chains:
+		buckets.setdefault(ref_index["fingerprint"], []).append((ref_chain_id, ref_index))
+	### Superimposition of each sample chain onto all the reference chains of its bucket in a single computation ###
+	transformations = {}
+	for sample_chain_id, sample_index in sample_chains:
+		if sample_index["fingerprint"] not in buckets:		#no reference chain has the same sequence, nothing to superimpose
+			continue
+		bucket = buckets[sample_index["fingerprint"]]
+		if excluded:
+			bucket = [(ref_chain_id, ref_index) for ref_chain_id, ref_index in bucket if (ref_chain_id, sample_chain_id) not in excluded]
+			if not bucket:
+				continue
+		## The RMSD of a pair of chains is at least the difference of their radii of gyration, the pairs above the threshold are not superimposed ##
+		bounds = numpy.abs(numpy.array([ref_index["gyration"] for ref_chain_id, ref_index in bucket]) - sample_index["gyration"])
+		for (ref_chain_id, ref_index), bound in zip(bucket, bounds):
+			if bound > rmsd_threshold + 1e-6:		#a margin for the rounding errors of the RMSD
+				transformations[(ref_chain_id, sample_chain_id)] = (float(bound), None, None)
+		bucket = [(ref_chain_id, ref_index) for (ref_chain_id, ref_index), bound in zip(bucket, bounds) if bound <= rmsd_threshold + 1e-6]
+		if not bucket:
+			continue
+		ref_coords = numpy.array([ref_index["coords"] for ref_chain_id, ref_index in bucket])
+		RMSDs, rotations, translations = Kabsch_superimposer(ref_coords, sample_index["coords"])
+		for (ref_chain_id, ref_index), RMSD, rotation, translation in zip(bucket, RMSDs, rotations, translations):
+			transformations[(ref_chain_id, sample_chain_id)] = (float(RMSD), rotation, translation)
+	### Goes through every superimposition, in the order of the chains of the reference and the sample structures ###
+	for ref_chain_id, ref_index in ref_chains:
+		for sample_chain_id, sample_index in sample_chains:
+			if (ref_chain_id, sample_chain_id) not in transformations:		#both chains do not have the same sequence
+				continue
+			RMSD = transformations[(ref_chain_id, sample_chain_id)][0]		#retrieves RMSD
+			all_superimpositions[(ref_chain_id, sample_chain_id)] = transformations[(ref_chain_id, sample_chain_id)]		#saving ALL superimpositions in a dictionary
+			if all_superimpositions[(ref_chain_id, sample_chain_id)][1] is None:		#not superimposed, see above
+				logger.debug("The RMSD between chain %s of the reference and chain %s of the sample is at least %f", ref_chain_id, sample_chain_id, RMSD)
+				continue
+			if RMSD > rmsd_threshold:
+				logger.debug("The RMSD between chain %s of the reference and chain %s of the sample is %f", ref_chain_id, sample_chain_id, RMSD)
+				continue
+			if prev_RMSD is True or RMSD < prev_RMSD:			#checks that the RMSD of this combination is smaller than the previous one
+				best_sample_chain_ID = sample_chain_id 		
+				best_ref_chain_ID = ref_chain_id 				#with this condition, the superimposition and other important
+				best_RMSD = RMSD 								#information pertaining to the superimposition with the smallest
+				prev_RMSD = RMSD 								#RMSD will be saved
+			superimposed_chains = True 							# The superimposition has been made
+			logger.debug("The RMSD between chain %s of the reference and chain %s of the sample is %f", ref_chain_id, sample_chain_id, RMSD)
+	all_superimpositions = sorted(all_superimpositions.items(), key=lambda k:k[1][0])		#sorting by the lowest RMSD and saving to a list
 	### checks that there has been, at least, one superimposition ###
 	if superimposed_chains is True:									
-		all_superimpositions = sorted(all_superimpositions.items(), key=lambda k:k[1].rms)		#sorting by the lowest RMSD and saving to a list
-		logging.info("The combination of chains with the lowest RMSD is ref chain %s and sample chain %s with an RMSD of %f", best_ref_chain_ID, best_sample_chain_ID, best_RMSD)
+		logger.debug("The combination of chains with the lowest RMSD is ref chain %s and sample chain %s with an RMSD of %f", best_ref_chain_ID, best_sample_chain_ID, best_RMSD)
 	return(all_superimpositions, superimposed_chains, best_RMSD)
 
-def MacrocomplexBuilder(ref_structure, files_list, it, not_added, command_arguments):
-	"""This recursive function superimposes the most similar chain of a binary interaction PDB file with a reference structure and adds the transformed chain to the building complex
+class SpatialIndex(object):
+	"""This class is a grid (cell list) containing the key atoms of all the chains of the complex, which is used to count the clashes between a chain and
+	every chain of the complex with a single query. The atoms are kept in arrays that only grow, and every cell of the grid keeps the positions of its
+	atoms in them, so adding a chain only touches the cells of the chain, whatever the size of the complex. It also keeps a bounding sphere of every
+	chain, so the atoms that are far from all the chains can be told apart without looking at the grid, see near
+
+	Arguments:
+
+	radius (float): distance (in angstroms) below which two atoms clash, it is also the size of the cells of the grid. By default it is 5
+
+	"""
+	offsets = numpy.array([(x, y, z) for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1)])		#the cell of an atom and its 26 neighbour cells
+
+	def __init__(self, radius = 5):
+		self.radius = radius
+		self.labels = []							#labels (chain IDs) of the chains in the grid, in the order they were added
+		self.cells = {}								#positions of the atoms of each cell in the arrays of atoms, by cell key
+		self.size = 0								#number of atoms in the grid, the rest of the arrays of atoms is free space
+		self.coords = numpy.empty((0, 3))			#coordinates of all the atoms in the grid, in the order they were added
+		self.chain_numbers = numpy.empty(0, dtype = int)		#position in labels of the chain of each atom
+		self.centers = numpy.empty((0, 3))			#center and radius of the bounding sphere of each chain, in the order of labels
+		self.radii = numpy.empty(0)
+
+	def cell_keys(self, cells):
+		"""Encodes the (x, y, z) integer coordinates of the cells in a single 64-bit integer"""
+		cells = cells + 2 ** 20		#21 bits for each dimension, enough for more than 5 million angstroms in each direction
+		return (cells[..., 0] << 42) | (cells[..., 1] << 21) | cells[..., 2]
+
+	def add(self, label, coords):
+		"""Adds a chain, identified by its label, with the coordinates of its key atoms to the grid"""
+		coords = numpy.asarray(coords, dtype = float).reshape(-1, 3)
+		number = len(self.labels)
+		self.labels.append(label)
+		## The arrays double their size when they are full, so each atom is copied a constant number of times on average ##
+		start, end = self.size, self.size + len(coords)
+		if end > len(self.coords):
+			capacity = max(2 * len(self.coords), end, 1024)
+			self.coords = numpy.concatenate([self.coords[:start], numpy.empty((capacity - start, 3))])
+			self.chain_numbers = numpy.concatenate([self.chain_numbers[:start], numpy.empty(capacity - start, dtype = int)])
+		if number == len(self.centers):
+			self.centers = numpy.concatenate([self.centers, numpy.empty((max(len(self.centers), 64), 3))])
+			self.radii = numpy.concatenate([self.radii, numpy.empty(max(len(self.radii), 64))])
+		self.coords[start:end] = coords
+		self.chain_numbers[start:end] = number
+		self.size = end
+		self.centers[number], self.radii[number] = self.bounding_sphere(coords)
+		## Adds the positions of the atoms of the chain to their cells ##
+		keys = self.cell_keys(numpy.floor(coords / self.radius).astype(numpy.int64))
+		order = numpy.argsort(keys, kind = "stable")
+		cell_keys, firsts = numpy.unique(keys[order], return_index = True)
+		for key, atoms in zip(cell_keys.tolist(), numpy.split(start + order, firsts[1:])):
+			self.cells[key] = numpy.concatenate([self.cells[key], atoms]) if key in self.cells else atoms
+
+	def bounding_sphere(self, coords):
+		"""Returns the center (the centroid of the atoms) and the radius of a sphere containing all the given atoms"""
+		if not len(coords):
+			return numpy.zeros(3), -numpy.inf		#an empty chain has no contacts
+		center = coords.mean(axis = 0)
+		return center, float(numpy.sqrt(((coords - center) ** 2).sum(axis = 1).max()))
+
+	def near(self, coords):
+		"""Checks if the bounding sphere of the given atoms is closer than the radius to the bounding sphere of any chain in the grid. If it is not, the
+		atoms have no contacts with any chain, see contacts"""
+		center, radius = self.bounding_sphere(numpy.asarray(coords, dtype = float))
+		distances = numpy.sqrt(((self.centers[:len(self.labels)] - center) ** 2).sum(axis = 1))
+		return bool((distances <= self.radii[:len(self.labels)] + radius + self.radius + 1e-6).any())		#a margin for the rounding errors of the distances
+
+	def contacts(self, coords, groups = None):
+		"""Counts, for every chain in the grid, the number of pairs of one of the given atoms and one atom of the chain closer than the radius
+
+		Arguments:
+
+		coords (numpy.array): array of shape (N, 3) with the coordinates of the atoms to check
+
+		groups (numpy.array): array of shape (N,) with the number of the group (e.g. the putative chain) of each atom, so several groups of atoms are
+		checked with a single query. By default None, all the atoms are counted together
+
+		Returns:
+
+		counts (numpy.array): array with the number of contacts with each chain, in the same order as labels, or an array of shape (G, len(labels)) with
+		the number of contacts of each group with each chain, if groups is given
+
+		"""
+		coords = numpy.asarray(coords, dtype = float)
+		if groups is not None:
+			groups = numpy.asarray(groups, dtype = int)
+			shape = (int(groups.max()) + 1 if len(groups) else 0, len(self.labels))
+		cells = numpy.floor(coords / self.radius).astype(numpy.int64)
+		neighbour_keys = self.cell_keys(cells[:, None, :] + self.offsets).ravel()		#keys of the 27 cells around each atom
+		## Gathers the atoms of every different neighbour cell once, the ones of each cell contiguous ##
+		cell_keys, inverse = numpy.unique(neighbour_keys, return_inverse = True)
+		cell_atoms = [self.cells.get(key) for key in cell_keys.tolist()]
+		cell_sizes = numpy.array([0 if atoms is None else len(atoms) for atoms in cell_atoms], dtype = int)
+		if cell_sizes.sum() == 0:
+			return numpy.zeros(len(self.labels) if groups is None else shape, dtype = int)
+		gathered = numpy.concatenate([atoms for atoms in cell_atoms if atoms is not None])
+		starts = (numpy.cumsum(cell_sizes) - cell_sizes)[inverse]		#position of the atoms of the neighbour cell of each pair in the gathered atoms
+		sizes = cell_sizes[inverse]
+		total = sizes.sum()
+		## Expands the ranges of atoms of every neighbour cell in pairs of query atom and grid atom ##
+		query_atoms = numpy.repeat(numpy.arange(len(neighbour_keys)) // len(self.offsets), sizes)
+		grid_atoms = gathered[numpy.arange(total) - numpy.repeat(numpy.cumsum(sizes) - sizes - starts, sizes)]
+		distances = ((coords[query_atoms] - self.coords[grid_atoms]) ** 2).sum(axis = 1)
+		in_contact = distances <= self.radius ** 2
+		if groups is None:
+			return numpy.bincount(self.chain_numbers[grid_atoms[in_contact]], minlength = len(self.labels))
+		pairs = groups[query_atoms[in_contact]] * shape[1] + self.chain_numbers[grid_atoms[in_contact]]		#a single count for every group and chain
+		return numpy.bincount(pairs, minlength = shape[0] * shape[1]).reshape(shape)
+
+def Interaction_graph(structures, macrocomplex):
+	"""This function clusters all the chains of the input files in chain types, chains with the same sequence fingerprint (see Chain_indexer), and builds
+	a graph linking every chain type to the files that contain it and to the chains of the complex that belong to it. The graph also keeps, for every
+	chain of every file, the chains of the complex it has already been rejected with. As the complex only grows, a superimposition that has been
+	rejected, because of its RMSD or its clashes, will always be rejected, so it never needs to be tried again. The number of superimpositions each file
+	can still try is kept up to date, so a chain added to the complex only updates the files that contain its chain type, see Pending_superimpositions
+
+	Arguments:
+
+	structures (dict): dictionary of preloaded structures of all the input files, as returned by Structures_loader
+
+	macrocomplex (list): the records of the chains of the complex, see Complex_initializer
+
+	Returns:
+
+	graph (dict): contains the files that contain each chain type ("files"), the chain ID and chain type of every chain of each file ("chains"), the IDs of
+	the chains of the complex of each chain type ("complex"), the IDs of the chains of the complex each chain of each file has been rejected with
+	("rejected"), which are updated every time a chain is added (see Chain_placer) or a superimposition is rejected (see Superimposition_rejector), and
+	the number of superimpositions of each file that have not been rejected yet ("pending")
+
+	"""
+	graph = {"files": {}, "chains": {}, "complex": {}, "rejected": {}, "pending": {}}
+	for file, entry in structures.items():
+		graph["chains"][file] = []
+		graph["pending"][file] = 0
+		for chain_id, index in entry["index"]:
+			fingerprint = index["fingerprint"]
+			graph["files"].setdefault(fingerprint, []).append(file)		#once for every chain of the file of that type
+			graph["chains"][file].append((chain_id, fingerprint))
+			graph["rejected"][(file, chain_id)] = set()
+	for record in macrocomplex:
+		Complex_chain_adder(graph, record["id"], record["index"]["fingerprint"])
+	logger.info("The input files contain %d different chain types" % len(graph["files"]))
+	return graph
+
+def Pending_superimpositions(graph, file):
+	"""This function returns the number of superimpositions between the chains of a file and the chains of the complex that have not been rejected yet.
+	If it is 0, the file cannot add any chain to the complex
 
 	Arguments:
 
-	ref_structure (Bio.PDB.Structure): is the structure on which the macrocomplex is gonna get build on every iteration of the function
+	graph (dict): the interaction graph, as returned by Interaction_graph
+
+	file (str): name of the file
+
+	Returns:
+
+	pending (int): number of superimpositions that can still be tried
+
+	"""
+	return graph["pending"][file]
+
+def Complex_chain_adder(graph, chain_id, fingerprint):
+	"""This function adds a chain of the complex to the interaction graph. Only the files that contain its chain type can be superimposed onto it, so
+	only their pending superimpositions increase, one for each of their chains of that type, see Interaction_graph"""
+	graph["complex"].setdefault(fingerprint, []).append(chain_id)
+	for file in graph["files"].get(fingerprint, []):
+		graph["pending"][file] += 1
+
+def Superimposition_rejector(graph, file, chain_id, ref_chain_id):
+	"""This function records in the interaction graph that a chain of a file has been rejected with a chain of the complex, which always has its same chain
+	type (see superimposition), so the file has one superimposition less to try, see Interaction_graph"""
+	if ref_chain_id not in graph["rejected"][(file, chain_id)]:		#a rejection is only counted once
+		graph["rejected"][(file, chain_id)].add(ref_chain_id)
+		graph["pending"][file] -= 1
+
+def File_evaluator(ref_chains, sample_chains, spatial_index, excluded, rmsd_threshold, clashes_threshold, all_candidates = False):
+	"""This function evaluates the superimpositions of the chains of a binary interaction file onto the chains of the complex, in order of RMSD, until it
+	finds a rotated chain that does not clash with any chain of the complex. It does not modify anything, so it can be run in a worker process against a
+	snapshot of the complex, see Complex_snapshot
+
+	Arguments:
+
+	ref_chains (list): list of tuples with the ID and the index of each chain of the complex, see Chain_indexer
+
+	sample_chains (list): list of tuples with the ID and the index of each chain of the file
+
+	spatial_index (SpatialIndex): grid containing the key atoms of all the chains of the complex, labelled by their chain IDs
+
+	excluded (set): set of tuples of reference and sample chain IDs already rejected, which are not superimposed again
+
+	rmsd_threshold (float): the RMSD threshold
+
+	clashes_threshold (int): the clashes threshold
+
+	all_candidates (boolean): if True, the evaluation does not stop at the first rotated chain that does not clash with the complex, and all of them are
+	returned, see Batch_building_iterator. By default False
+
+	Returns:
+
+	evaluation (dict): contains the list of tuples of reference and sample chain IDs of the superimpositions rejected in this evaluation ("rejected"),
+	the accepted superimposition ("accepted"), a dictionary with the reference and sample chain IDs ("chains"), the ID of the chain to add ("chain_to_add"),
+	the RMSD ("rmsd"), the ROTATION matrix ("rotation"), the TRANSLATION vector ("translation") and the transformed key atom coordinates of the chain to add ("coords"), or None,
+	the list of all the accepted superimpositions ("candidates"), if all_candidates is True, the number of superimpositions, clash queries and rejections
+	("counts") and the time spent ("time"), see Metrics
+
+	"""
+	evaluation = {"rejected": [], "accepted": None, "candidates": [], "counts": {"superimpositions": 0, "rmsd_rejections": 0, "rmsd_bound_rejections": 0,
+					"clash_queries": 0, "coarse_accepts": 0, "coarse_rejections": 0, "clash_rejections": 0}}
+	coarse_atoms = 32		#key atoms of the subsample of the chain to add whose clashes are counted before the ones of the whole chain
+	start = timeit.default_timer()
+	debug = logger.isEnabledFor(logging.DEBUG)		#the superimpositions and clashes of every pair of chains are only logged in debug mode
+	counts = evaluation["counts"]
+	### Calling the superimposition function to obtain the superimposition of every combination of pairs of chains between the reference and sample structures
+	all_superimpositions, superimposed_chains, best_RMSD = superimposition(ref_chains, sample_chains, rmsd_threshold, excluded = excluded)
+	for chains, (RMSD, rotation, translation) in all_superimpositions:		#the superimpositions above the RMSD threshold will never be valid
+		if rotation is None:		#rejected by the radii of gyration of the chains, without superimposing them
+			counts["rmsd_bound_rejections"] += 1
+		else:
+			counts["superimpositions"] += 1
+		if RMSD > rmsd_threshold:
+			evaluation["rejected"].append(chains)
+			counts["rmsd_rejections"] += 1
+	### There are superimposed chains and the RMSD is below the threshold --> A chain may be added ###
+	if superimposed_chains is True and best_RMSD <= rmsd_threshold:
+		sample_indexes = dict(sample_chains)
+		## Loops through the superimposition dictionary, obtaining the superimpositions and the reference and sample IDs ##
+		for chains, (RMSD, rotation, translation) in all_superimpositions:
+			logger.debug("We are processing the superimposition of ref chain %s with sample chain %s with an RMSD of %f", chains[0], chains[1], RMSD)
+			if RMSD > rmsd_threshold:			#Checks that the superimposition has an RMSD above the threshold, they are at the end of the list
+				break
+			## Gets the sample chain that was not superimposed with the reference chain --> putative chain to add ##
+			chain_to_add = [chain_id for chain_id, index in sample_chains if chain_id != chains[0]][0]
+			sample_coords = numpy.dot(sample_indexes[chain_to_add]["coords"], rotation) + translation		#applies ROTATION and TRANSLATION matrices to the key atoms (CA or C4') of chain_to_add
+			logger.debug("Putative chain to add is %s", chain_to_add)
+			## Counts the clashes between the chain to add and every chain from the reference structure with a single query to the spatial index ##
+			counts["clash_queries"] += 1
+			if not spatial_index.near(sample_coords):		#far from every chain of the complex, it has no clashes at all
+				all_clashes = numpy.zeros(len(spatial_index.labels), dtype = int)
+				counts["coarse_accepts"] += 1
+			else:
+				all_clashes = None
+				stride = len(sample_coords) // coarse_atoms
+				if stride > 1 and not debug:		#in debug mode the clashes with every chain are logged, so they are always counted with all the atoms
+					coarse_clashes = spatial_index.contacts(sample_coords[::stride])		#a subsample never has more clashes than the whole chain
+					if coarse_clashes.max() > clashes_threshold:		#usually the chain to add lands on top of a chain of the complex
+						all_clashes = coarse_clashes
+						counts["coarse_rejections"] += 1
+				if all_clashes is None:
+					all_clashes = spatial_index.contacts(sample_coords)
+			present_chain = bool(len(all_clashes) and all_clashes.max() > clashes_threshold)		#if True, chain_to_add is considered a chain already present in the complex
+			if debug:
+				for chain_id, clashes in zip(spatial_index.labels, all_clashes):
+					if clashes > clashes_threshold:		#checks that the number of total clashes is above the threshold
+						logger.debug("The number of clashes between the chain to add %s and reference chain %s is %d, therefore the chain is skipped", chain_to_add, chain_id, clashes)
+						break 									#skips continuing through the loop, as it already clashes with one reference chain
+					## Checks that the number of total clashes is under the threshold ##
+					elif clashes > 0:		
+						logger.debug("The number of clashes between the chain to add %s and reference chain %s is %d, it is under the threshold", chain_to_add, chain_id, clashes)
+			if present_chain is True:		#the complex only grows, so this chain will always clash
+				evaluation["rejected"].append(chains)
+				counts["clash_rejections"] += 1
+			## Rotated chain to add is not a chain already in the building macrocomplex structure ##
+			else:
+				candidate = {"chains": chains, "chain_to_add": chain_to_add, "rmsd": RMSD, "rotation": rotation, "translation": translation, "coords": sample_coords}
+				if evaluation["accepted"] is None:
+					evaluation["accepted"] = candidate
+				evaluation["candidates"].append(candidate)
+				if not all_candidates:
+					break
+	evaluation["time"] = timeit.default_timer() - start
+	return evaluation
+
+def File_processor(macrocomplex, sample, command_arguments, structures, spatial_index, interaction_graph, evaluation = None, trajectory = None, metrics = None):
+	"""This function superimposes the most similar chain of a binary interaction PDB file with a reference structure and adds the transformed chain to
+	the building complex, if it does not clash with any chain already present in it. It processes a single file, i.e., it is one iteration of the
+	building process, see Building_iterator
+
+	Arguments:
+
+	macrocomplex (list): the records of the chains of the complex, see Complex_initializer
+
+	sample (str): name of the binary interaction PDB file to process
+
+	command_arguments(argparse object): is the object containing all the command-line arguments, see MacrocomplexBuilder
+
+	structures (dict): dictionary of preloaded structures of all the input files, as returned by Structures_loader
+
+	spatial_index (SpatialIndex): grid containing the key atoms of all the chains of the complex, labelled by their chain IDs
+
+	interaction_graph (dict): the interaction graph of the input files and the complex, as returned by Interaction_graph
+
+	evaluation (dict): the evaluation of the file against the current complex, as returned by File_evaluator, if it has already been done by a worker
+	process. By default None, then the file is evaluated here
+
+	trajectory (Trajectory_writer): the writer of the building steps, if the user wants them to be saved, see Trajectory_writer. By default None
+
+	metrics (Metrics): if provided, the evaluation of the file and the added chain are counted in it. By default None
+
+	Returns:
+
+	ID (str): the ID of the chain added to the complex, or None if no chain has been added
+
+	"""
+	logger.info("We are processing the file %s" % (sample))
+	### Checks in the interaction graph that the file shares a chain type with a chain of the complex it has not been rejected with ###
+	if Pending_superimpositions(interaction_graph, sample) == 0:
+		logger.info("The file %s cannot extend the complex at this point, it is skipped" % (sample))
+		if metrics is not None:
+			metrics.skipped(sample)
+		return None
+	if evaluation is None:
+		ref_chains = [(record["id"], record["index"]) for record in macrocomplex]
+		evaluation = File_evaluator(ref_chains, structures[sample]["index"], spatial_index, Rejected_superimpositions(interaction_graph, sample), command_arguments.rmsd_threshold, command_arguments.clashes)
+	else:
+		Worker_log(evaluation)		#only the evaluations used are logged, the ones discarded are never written
+	if metrics is not None:
+		metrics.evaluated(sample, evaluation)
+	for chains in evaluation["rejected"]:		#the complex only grows, so the rejected superimpositions will always be rejected
+		Superimposition_rejector(interaction_graph, sample, chains[1], chains[0])
+	accepted = evaluation["accepted"]
+	if accepted is None:
+		return None
+	start = timeit.default_timer()
+	ID = Chain_placer(macrocomplex, sample, accepted, structures, spatial_index, interaction_graph, trajectory)
+	if metrics is not None:
+		metrics.added(sample, timeit.default_timer() - start)
+	return ID
+
+def Chain_placer(macrocomplex, sample, accepted, structures, spatial_index, interaction_graph, trajectory = None):
+	"""This function adds the chain of an accepted superimposition to the building complex, with its original ID or with a new one. The chain is not
+	copied, the complex only keeps a record of the file and chain it comes from and of the transformation applied to it, together with the transformed
+	coordinates of its key atoms, which are the only ones needed to build the complex. The atoms are only placed when the complex is written, see
+	Complex_materializer
+
+	Arguments:
+
+	macrocomplex (Macrocomplex): the complex, see Macrocomplex
+
+	sample (str): name of the binary interaction PDB file the chain comes from
+
+	accepted (dict): the accepted superimposition, as returned by File_evaluator
+
+	structures, spatial_index and interaction_graph are the same as in File_processor, and are updated with the added chain
+
+	trajectory (Trajectory_writer): if provided, the record of the added chain is sent to it. By default None
+
+	Returns:
+
+	ID (str): the ID of the chain added to the complex
+
+	"""
+	chains = accepted["chains"]
+	if chains[1] == "*":		#a symmetric copy of a chain of the complex, see Symmetry_expander
+		logger.info("The symmetric copy of chain %s is not in the complex" % chains[0])
+	else:
+		logger.info("Chain %s superimposed with chain %s yields rotated chain %s which is not in the complex" %(chains[0],chains[1],accepted["chain_to_add"]))
+	ID = macrocomplex.ids.allocate(accepted["chain_to_add"])		#a free ID, the one of the chain in its file if possible
+	index = dict(structures[sample]["index"])[accepted["chain_to_add"]]
+	record = {"id": ID, "file": sample, "source_chain": accepted["chain_to_add"], "ref_chain": chains[0], "sample_chain": chains[1], "rmsd": accepted["rmsd"],
+			"rotation": accepted["rotation"], "translation": accepted["translation"], "index": dict(index, coords = accepted["coords"])}		#the index of the chain in the complex keeps its new coordinates
+	macrocomplex.append(record)		#adds the chain to the building macrocomplex
+	spatial_index.add(ID, accepted["coords"])	#and its key atoms to the spatial index
+	Complex_chain_adder(interaction_graph, ID, index["fingerprint"])		#and to the interaction graph
+	start, end = structures[sample]["chains"][accepted["chain_to_add"]]
+	macrocomplex.atoms += end - start		#the atoms of the complex are counted here, so they are never counted again when it is written
+	logger.info("Added Chain %s" % ID)
+	if trajectory is not None:
+		trajectory.add(record)
+	return ID
+
+def Complex_initializer(structures, file):
+	"""This function creates the initial complex with all the chains of a file, in their original position. The complex is a list of records, one for each
+	chain, with its ID in the complex ("id"), the file ("file") and chain ("source_chain") it comes from, the reference and sample chain IDs of the
+	superimposition that placed it ("ref_chain" and "sample_chain", "." for the initial chains), its RMSD ("rmsd"), the ROTATION matrix ("rotation") and
+	TRANSLATION vector ("translation") applied to it and its index with the transformed coordinates of its key atoms ("index"), see Chain_indexer
+
+	Arguments:
+
+	structures (dict): dictionary of preloaded structures of all the input files, as returned by Structures_loader
+
+	file (str): name of the file used as the initial complex
+
+	Returns:
+
+	macrocomplex (Macrocomplex): the records of the chains of the initial complex, see Macrocomplex
+
+	"""
+	return Macrocomplex([{"id": chain_id, "file": file, "source_chain": chain_id, "ref_chain": ".", "sample_chain": ".", "rmsd": 0.0, "rotation": numpy.identity(3),
+			"translation": numpy.zeros(3), "index": index} for chain_id, index in structures[file]["index"]], structures)
+
+class Macrocomplex(list):
+	"""This class is the building complex: the list of the records of its chains (see Complex_initializer), which also keeps the allocator of the IDs of
+	its chains (ids, see ID_allocator) and its number of atoms (atoms). Both are updated every time a chain is added, see Chain_placer
+
+	Arguments:
+
+	records (list): the records of the chains of the complex
+
+	structures (dict): dictionary of preloaded structures of the files the chains come from, as returned by Structures_loader
+
+	"""
+	def __init__(self, records, structures):
+		list.__init__(self, records)
+		self.ids = ID_allocator([record["id"] for record in records])
+		self.atoms = 0
+		for record in records:
+			start, end = structures[record["file"]]["chains"][record["source_chain"]]
+			self.atoms += end - start
+
+def Complex_materializer(macrocomplex, structures):
+	"""This function builds the atomic structure of the complex from the records of its chains. Each chain is copied from the preloaded structure of its
+	file and its atoms are placed by applying its transformation to their pristine coordinates, so the preloaded structures are never modified
+
+	Arguments:
+
+	macrocomplex (list): the records of the chains of the complex, see Complex_initializer
+
+	structures (dict): dictionary of preloaded structures of the files the chains come from, as returned by Structures_loader
+
+	Returns:
+
+	structure (Bio.PDB.Structure): the structure of the complex, with a single model
+
+	"""
+	structure = Bio.PDB.Structure.Structure("macrocomplex")
+	structure.add(Bio.PDB.Model.Model(0))
+	for record in macrocomplex:
+		entry = structures[record["file"]]
+		chain = Structure_topology(entry)[0][record["source_chain"]].copy()
+		start, end = entry["chains"][record["source_chain"]]
+		for atom, coord in zip(Unpacked_atoms(chain), numpy.dot(entry["coords"][start:end], record["rotation"]) + record["translation"]):		#same order as the atoms of the file
+			atom.coord = coord
+		chain.id = record["id"]
+		structure[0].add(chain)
+	return structure
+
+def Atom_templates(entry, chain_id, mmcif = False):
+	"""This function formats, only once, the lines of all the atoms of a chain of a preloaded structure, leaving as fields the values that change from one
+	copy of the chain to another: the serial number, the chain ID and the coordinates of every atom. The lines in PDB format are taken from Bio.PDB.PDBIO,
+	so they are exactly the same, and the ones in mmCIF format are the rows of the atom_site loop of Trajectory_writer, which also leave the model number
+	as a field
+
+	Arguments:
+
+	entry (dict): the preloaded structure the chain belongs to, as returned by Structure_parser
+
+	chain_id (str): the ID of the chain in its file
+
+	mmcif (boolean): if True, the lines are in mmCIF format, otherwise in PDB format. By default False
+
+	Returns:
+
+	lines (list): the lines of the atoms of the chain, in the same order as the atoms of the file, to be formatted with the serial number, chain ID and
+	X, Y, Z coordinates of each atom (and the chain ID and model number again, in mmCIF format)
+
+	ter (str): the TER line of the chain, to be formatted with its serial number and chain ID, or None in mmCIF format
+
+	"""
+	start, end = entry["chains"][chain_id]
+	structure = Structure_topology(entry)
+	lines = []
+	if mmcif:
+		residues = 0		#the label_seq_id of the residues of the polymer are numbered from 1, as Bio.PDB.MMCIFIO does, the hetero residues have none
+		residue = None
+		for atom in entry["atoms"][start:end]:
+			if atom.get_parent() is not residue:
+				residue = atom.get_parent()
+				hetero, number, insertion = residue.id
+				if hetero == " ":
+					residues += 1
+			lines.append("%s %%d %s %s %s %s %%s ? %s %s %%.3f %%.3f %%.3f %s %s %d %%s %%d\n" % ("ATOM" if hetero == " " else "HETATM", atom.element or "?", atom.get_id(),
+				atom.altloc.strip() or ".", residue.resname.strip() or "?", residues if hetero == " " else ".", insertion.strip() or "?",
+				atom.occupancy if atom.occupancy is not None else "?", atom.bfactor if atom.bfactor is not None else "?", number))
+		return lines, None
+	handle = io.StringIO()
+	pdbio = Bio.PDB.PDBIO()
+	pdbio.set_structure(structure[0][chain_id])
+	pdbio.save(handle, write_end = False)		#all the atoms, in the same order as Unpacked_atoms
+	for line in handle.getvalue().splitlines(True):		#the serial number is in the columns 7-11, the chain ID in 22 and the coordinates in 31-54
+		if line.startswith("TER"):
+			ter = line[:6] + "%5d" + line[11:21] + "%s" + line[22:]
+		else:
+			lines.append(line[:6] + "%5d" + line[11:21] + "%s" + line[22:30] + "%8.3f%8.3f%8.3f" + line[54:])
+	return lines, ter
+
+def Complex_writer(macrocomplex, structures, outdir = "."):
+	"""This function writes the complex from the records of its chains, placing the atoms of each chain as it is written, without building the atomic
+	structure of the complex (see Complex_materializer). The lines of the atoms of every chain of the input files are only formatted once (see
+	Atom_templates), so only the serial number, the chain ID and the coordinates are filled for each chain of the complex. The complex is saved in PDB
+	format, exactly as Bio.PDB.PDBIO would save it, unless it has more than 99,999 atoms or 62 chains, above the limits of the PDB format, then it is
+	saved in mmCIF format, in a single model
+
+	Arguments:
+
+	macrocomplex (list): the records of the chains of the complex. If it is a Macrocomplex, its atoms have already been counted while it was being built,
+	see Macrocomplex, otherwise they are counted here
+
+	structures (dict): dictionary of preloaded structures of the files the chains come from, as returned by Structures_loader
+
+	outdir (str): the folder where the file is saved. By default the current folder
+
+	Returns:
+
+	path (str): the path of the saved file, macrocomplex.pdb or macrocomplex.cif
+
+	"""
+	if not isinstance(macrocomplex, Macrocomplex):
+		macrocomplex = Macrocomplex(macrocomplex, structures)		#counts its atoms
+	mmcif = macrocomplex.atoms > 99999 or len(macrocomplex) > 62
+	path = os.path.join(outdir, "macrocomplex.cif" if mmcif else "macrocomplex.pdb")
+	templates = {}		#the lines of the atoms of every chain of the input files in the complex
+	serial = 0			#number of atoms written
+	with open(path, "w") as fh:
+		if mmcif:
+			fh.write("data_macrocomplex\n#\nloop_\n" + "".join(["_atom_site.%s\n" % field for field in Trajectory_writer.atom_site]))
+		for record in macrocomplex:
+			entry = structures[record["file"]]
+			if (record["file"], record["source_chain"]) not in templates:
+				templates[(record["file"], record["source_chain"])] = Atom_templates(entry, record["source_chain"], mmcif)
+			lines, ter = templates[(record["file"], record["source_chain"])]
+			start, end = entry["chains"][record["source_chain"]]
+			coords = (numpy.dot(entry["coords"][start:end], record["rotation"]) + record["translation"]).tolist()		#same order as the atoms of the file
+			if mmcif:
+				fh.write("".join([line % (serial + number, record["id"], x, y, z, record["id"], 1) for number, (line, (x, y, z)) in enumerate(zip(lines, coords), 1)]))
+			else:
+				fh.write("".join([line % (serial + number, record["id"], x, y, z) for number, (line, (x, y, z)) in enumerate(zip(lines, coords), 1)]))
+				fh.write(ter % (serial + len(lines) + 1, record["id"]))		#the TER record does not take a serial number
+			serial += len(lines)
+		fh.write("#\n" if mmcif else "END   \n")
+	return path
+
+class Trajectory_writer(object):
+	"""This class saves the building steps of the macrocomplex while it is being built. Instead of writing the whole complex every time a chain is
+	added, only the atoms of the new chain are appended to a trajectory file, a mmCIF file in which the chains added in each step belong to a different
+	model (pdbx_PDB_model_num), so the complex at any step is the union of the models up to it. The transformation applied to every added chain is also
+	appended to a tab-separated file, so any intermediate complex can be rebuilt from the input files, see Complex_rebuilder. The files are written by a
+	background thread, so the building process is never blocked by them
+
+	Arguments:
+
+	structures (dict): dictionary of preloaded structures of all the input files, as returned by Structures_loader
+
+	outdir (str): the folder where the files are saved. By default the current folder
+
+	"""
+	atom_site = ["group_PDB", "id", "type_symbol", "label_atom_id", "label_alt_id", "label_comp_id", "label_asym_id", "label_entity_id", "label_seq_id",
+				"pdbx_PDB_ins_code", "Cartn_x", "Cartn_y", "Cartn_z", "occupancy", "B_iso_or_equiv", "auth_seq_id", "auth_asym_id", "pdbx_PDB_model_num"]
+	transforms_header = ["step", "chain", "file", "source_chain", "ref_chain", "sample_chain", "rmsd"] + ["r%d%d" % (i, j) for i in range(1, 4) for j in range(1, 4)] + ["t1", "t2", "t3"]
+
+	def __init__(self, structures, outdir = "."):
+		self.structures = structures		#the atoms of the chains are taken from the preloaded structures, which are never modified
+		self.trajectory_path = os.path.join(outdir, "macrocomplex_trajectory.cif")
+		self.transforms_path = os.path.join(outdir, "macrocomplex_transforms.tsv")
+		self.step = 0			#number of chains added since the initial complex
+		self.serial = 0			#number of atoms written
+		self.templates = {}		#the rows of the atoms of every chain of the input files in the trajectory, see Atom_templates
+		self.error = None		#exception raised in the background thread, raised again by close
+		self.queue = queue.Queue()
+		self.thread = threading.Thread(target = self.run, daemon = True)
+		self.thread.start()
+
+	def start(self, macrocomplex):
+		"""Sends the records of the chains of the initial complex as the step 0, see Complex_initializer. If the complex already has added chains, e.g.
+		when the building process is resumed from a checkpoint, each of them is sent as a new step"""
+		for record in macrocomplex:
+			if record["ref_chain"] == ".":		#a chain of the initial complex
+				self.queue.put((0, record))
+			else:
+				self.add(record)
+
+	def add(self, record):
+		"""Sends the record of a chain added to the complex as a new step, see Chain_placer"""
+		self.step += 1
+		self.queue.put((self.step, record))
+
+	def run(self):
+		"""Writes the steps received until close is called, this is the target of the background thread"""
+		try:
+			with open(self.trajectory_path, "w") as trajectory, open(self.transforms_path, "w") as transforms:
+				trajectory.write("data_macrocomplex_trajectory\n#\nloop_\n" + "".join(["_atom_site.%s\n" % field for field in self.atom_site]))
+				transforms.write("\t".join(self.transforms_header) + "\n")
+				while True:
+					item = self.queue.get()
+					if item is None:		#close has been called
+						break
+					step, record = item
+					trajectory.write(self.atom_lines(step, record))
+					values = [step, record["id"], record["file"], record["source_chain"], record["ref_chain"], record["sample_chain"], float(record["rmsd"])]
+					values += [float(value) for value in numpy.ravel(record["rotation"])] + [float(value) for value in record["translation"]]
+					transforms.write("\t".join([str(value) for value in values]) + "\n")		#str of a float keeps all its digits, so the complex can be rebuilt exactly
+					if self.queue.empty():		#the files are complete up to the last step whenever the build waits for the writer
+						trajectory.flush()
+						transforms.flush()
+				trajectory.write("#\n")
+		except Exception as error:
+			self.error = error
+			while self.queue.get() is not None:		#keeps consuming, so close does not wait forever
+				pass
+
+	def atom_lines(self, step, record):
+		"""Returns the rows of the atom_site loop with all the atoms of the chain of a record, placed by its transformation, in the model of the given step"""
+		entry = self.structures[record["file"]]
+		if (record["file"], record["source_chain"]) not in self.templates:
+			self.templates[(record["file"], record["source_chain"])] = Atom_templates(entry, record["source_chain"], True)[0]
+		lines = self.templates[(record["file"], record["source_chain"])]
+		start, end = entry["chains"][record["source_chain"]]
+		coords = (numpy.dot(entry["coords"][start:end], record["rotation"]) + record["translation"]).tolist()
+		serial = self.serial
+		self.serial += len(lines)
+		return "".join([line % (serial + number, record["id"], x, y, z, record["id"], step + 1) for number, (line, (x, y, z)) in enumerate(zip(lines, coords), 1)])		#models are numbered from 1
+
+	def close(self):
+		"""Waits until all the steps have been written and closes the files"""
+		self.queue.put(None)
+		self.thread.join()
+		if self.error is not None:
+			raise self.error
+
+def Transforms_reader(transforms_path):
+	"""This function reads the transformations saved by a Trajectory_writer
+
+	Arguments:
+
+	transforms_path (str): path of the macrocomplex_transforms.tsv file
+
+	Returns:
+
+	records (list): list of dictionaries, one for each added chain, with the same keys as the columns of the file plus the ROTATION matrix ("rotation")
+	and the TRANSLATION vector ("translation"), in the order the chains were added. The ID of the chain in the complex is kept as "id", like in the
+	records of the complex, see Complex_initializer
+
+	"""
+	records = []
+	with open(transforms_path) as transforms:
+		header = transforms.readline().rstrip("\n").split("\t")
+		for line in transforms:
+			record = dict(zip(header, line.rstrip("\n").split("\t")))
+			record["id"] = record.pop("chain")		#same keys as the records of the complex, see Complex_initializer
+			record["step"] = int(record["step"])
+			record["rmsd"] = float(record["rmsd"])
+			record["rotation"] = numpy.array([float(record["r%d%d" % (i, j)]) for i in range(1, 4) for j in range(1, 4)]).reshape(3, 3)
+			record["translation"] = numpy.array([float(record["t%d" % i]) for i in range(1, 4)])
+			records.append(record)
+	return records
+
+def Complex_rebuilder(indir, transforms_path, step = None, cache_dir = None):
+	"""This function rebuilds the complex at any step of the building process from the input files and the transformations saved by a Trajectory_writer
+
+	Arguments:
+
+	indir (str): the input directory with the binary interaction PDB files used to build the complex
+
+	transforms_path (str): path of the macrocomplex_transforms.tsv file
+
+	step (int): the step of the complex to rebuild, 0 is the initial complex. By default None, the final complex
+
+	cache_dir (str): folder of the parsed input files, see Structure_parser. By default None
+
+	Returns:
+
+	structure (Bio.PDB.Structure): the complex at the given step
+
+	"""
+	records = [record for record in Transforms_reader(transforms_path) if step is None or record["step"] <= step]
+	structures = Structures_loader(indir, sorted(set([record["file"] for record in records])), cache_dir)
+	return Complex_materializer(records, structures)
+
+class Metrics(object):
+	"""This class keeps the counters and timers of the building process: iterations, evaluated and skipped files, superimpositions, clash queries,
+	rejections and added chains, in total and for each input file. They are taken from the evaluations of the files (see File_evaluator), so they are
+	also counted when the files are evaluated by worker processes. A summary can be logged periodically and everything can be exported to JSON and CSV
+
+	Arguments:
+
+	interval (int): a summary is logged every this number of iterations. By default 0, never
+
+	"""
+	counter_names = ["iterations", "files_evaluated", "files_skipped", "superimpositions", "rmsd_rejections", "rmsd_bound_rejections", "clash_queries",
+					"coarse_accepts", "coarse_rejections", "clash_rejections", "duplicate_rejections", "discarded_evaluations", "symmetry_generators",
+					"symmetry_copies", "added_chains"]
+	file_counter_names = ["evaluations", "skipped", "superimpositions", "clash_queries", "added_chains"]
+
+	def __init__(self, interval = 0):
+		self.interval = interval
+		self.counters = dict([(name, 0) for name in self.counter_names])
+		self.timers = {"evaluation": 0.0, "placement": 0.0}		#seconds spent evaluating files, in the workers if any, and adding chains
+		self.files = {}		#counters of each file
+		self.start = timeit.default_timer()
+
+	def file(self, file):
+		"""Returns the counters of a file"""
+		if file not in self.files:
+			self.files[file] = dict([(name, 0) for name in self.file_counter_names])
+		return self.files[file]
+
+	def evaluated(self, file, evaluation):
+		"""Counts the evaluation of a file, see File_evaluator"""
+		self.counters["files_evaluated"] += 1
+		for name, count in evaluation["counts"].items():
+			self.counters[name] += count
+		self.timers["evaluation"] += evaluation["time"]
+		file_counters = self.file(file)
+		file_counters["evaluations"] += 1
+		file_counters["superimpositions"] += evaluation["counts"]["superimpositions"]
+		file_counters["clash_queries"] += evaluation["counts"]["clash_queries"]
+
+	def skipped(self, file):
+		"""Counts a file skipped because it cannot extend the complex, see Pending_superimpositions"""
+		self.counters["files_skipped"] += 1
+		self.file(file)["skipped"] += 1
+
+	def added(self, file, seconds):
+		"""Counts a chain of a file added to the complex, and the time spent adding it"""
+		self.counters["added_chains"] += 1
+		self.file(file)["added_chains"] += 1
+		self.timers["placement"] += seconds
+
+	def iteration(self):
+		"""Counts an iteration of the building process, and logs the summary if it is time to"""
+		self.counters["iterations"] += 1
+		if self.interval and self.counters["iterations"] % self.interval == 0:
+			self.emit()
+
+	def summary(self):
+		"""Returns all the counters and timers, and the acceptance rate (added chains per evaluation) of each file"""
+		files = {}
+		for file, counters in self.files.items():
+			files[file] = dict(counters, acceptance_rate = float(counters["added_chains"]) / counters["evaluations"] if counters["evaluations"] else 0.0)
+		return {"counters": dict(self.counters), "timers": dict(self.timers, total = timeit.default_timer() - self.start), "files": files}
+
+	def emit(self):
+		"""Logs a summary of the counters"""
+		logger.info("Metrics: %s" % ", ".join(["%s %d" % (name, count) for name, count in self.counters.items()]))
+
+	def export(self, json_path, csv_path):
+		"""Saves the summary in a JSON file, and the counters of each file in a CSV file"""
+		summary = self.summary()
+		with open(json_path, "w") as fh:
+			json.dump(summary, fh, indent = 1)
+		with open(csv_path, "w") as fh:
+			fh.write(",".join(["file"] + self.file_counter_names + ["acceptance_rate"]) + "\n")
+			for file, counters in sorted(summary["files"].items()):
+				fh.write(",".join([file] + [str(counters[name]) for name in self.file_counter_names] + ["%.4f" % counters["acceptance_rate"]]) + "\n")
+
+def Checkpoint_writer(checkpoint_path, macrocomplex, files_list, it, not_added, interaction_graph, command_arguments):
+	"""This function saves the state of the building process in a JSON file, so it can be resumed later, see Checkpoint_reader. Only the records of the
+	chains of the complex (without their indexes, which are computed again from the input files), the order of the list of files, the counters of the
+	building process and the rejected superimpositions are saved, so it is cheap enough to be called every few iterations. The file is written with
+	another name and then renamed, so a checkpoint is never left half written
+
+	Arguments:
+
+	checkpoint_path (str): path of the checkpoint file
+
+	macrocomplex (list): the records of the chains of the complex, see Complex_initializer
+
+	files_list (list): the list of files, in the order they will be processed
+
+	it (int): the number of iterations of the building process
+
+	not_added (int): the number of files processed since the last chain was added
+
+	interaction_graph (dict): the interaction graph, see Interaction_graph
+
+	command_arguments(argparse object): the command-line arguments, the input files and the parameters that change the complex are saved to check
+	that the build is resumed with the same ones
+
+	"""
+	records = []
+	for record in macrocomplex:
+		records.append({"id": record["id"], "file": record["file"], "source_chain": record["source_chain"], "ref_chain": record["ref_chain"],
+						"sample_chain": record["sample_chain"], "rmsd": float(record["rmsd"]), "rotation": numpy.asarray(record["rotation"]).tolist(),
+						"translation": numpy.asarray(record["translation"]).tolist()})
+	rejected = [[file, chain_id, sorted(ref_chain_ids)] for (file, chain_id), ref_chain_ids in interaction_graph["rejected"].items() if ref_chain_ids]
+	checkpoint = {"files": sorted(files_list), "rmsd_threshold": command_arguments.rmsd_threshold, "clashes": command_arguments.clashes,
+				"batch": getattr(command_arguments, "batch", False), "symmetry": getattr(command_arguments, "symmetry", False), "macrocomplex": records, "files_list": files_list, "it": it, "not_added": not_added,
+				"rejected": rejected}
+	with open(checkpoint_path + ".tmp", "w") as fh:
+		json.dump(checkpoint, fh)
+	os.replace(checkpoint_path + ".tmp", checkpoint_path)		#the previous checkpoint is only replaced by a complete one
+	logger.info("Checkpoint of iteration %d saved in %s" % (it, os.path.abspath(checkpoint_path)))
+
+def Checkpoint_reader(checkpoint_path, structures):
+	"""This function reads the state of the building process saved by Checkpoint_writer
+
+	Arguments:
+
+	checkpoint_path (str): path of the checkpoint file
+
+	structures (dict): dictionary of preloaded structures of all the input files, as returned by Structures_loader, used to compute again the indexes of
+	the chains of the complex
+
+	Returns:
+
+	checkpoint (dict): contains the same keys as the file, with the complex ("macrocomplex") as in Complex_initializer
+
+	"""
+	with open(checkpoint_path) as fh:
+		checkpoint = json.load(fh)
+	for record in checkpoint["macrocomplex"]:
+		record["rotation"] = numpy.array(record["rotation"])
+		record["translation"] = numpy.array(record["translation"])
+		index = dict(structures[record["file"]]["index"])[record["source_chain"]]
+		if record["ref_chain"] == ".":		#a chain of the initial complex, in its original position
+			record["index"] = index
+		else:		#the same operation as in File_evaluator, so the coordinates are exactly the same
+			record["index"] = dict(index, coords = numpy.dot(index["coords"], record["rotation"]) + record["translation"])
+	checkpoint["macrocomplex"] = Macrocomplex(checkpoint["macrocomplex"], structures)
+	return checkpoint
+
+def Rejected_superimpositions(graph, file):
+	"""This function returns the set of tuples of reference and sample chain IDs of the superimpositions of a file already rejected, see Interaction_graph"""
+	return set([(ref_chain_id, chain_id) for chain_id, fingerprint in graph["chains"][file] for ref_chain_id in graph["rejected"][(file, chain_id)]])
+
+def Complex_snapshot(macrocomplex):
+	"""This function copies the key atom coordinates of all the chains of the complex to a block of shared memory, so worker processes can evaluate
+	files against the complex without receiving a copy of it with every file
+
+	Arguments:
+
+	macrocomplex (list): the records of the chains of the complex, see Complex_initializer
+
+	Returns:
+
+	shared_memory (multiprocessing.shared_memory.SharedMemory): the block of shared memory, which must be closed and unlinked by the caller
+
+	snapshot (dict): the description of the snapshot to send to the workers: the name of the block of shared memory ("name"), the total number of key
+	atoms ("atoms") and the ID, fingerprint, radius of gyration and start and end positions of the key atoms of each chain of the complex ("chains")
+
+	"""
+	indexes = [(record["id"], record["index"]) for record in macrocomplex]
+	coords = numpy.concatenate([index["coords"] for chain_id, index in indexes])
+	shared_memory = multiprocessing.shared_memory.SharedMemory(create = True, size = coords.nbytes)
+	numpy.ndarray(coords.shape, dtype = coords.dtype, buffer = shared_memory.buf)[:] = coords
+	chains = []
+	start = 0
+	for chain_id, index in indexes:
+		chains.append((chain_id, index["fingerprint"], index["gyration"], start, start + len(index["coords"])))
+		start += len(index["coords"])
+	return shared_memory, {"name": shared_memory.name, "atoms": len(coords), "chains": chains}
+
+worker_state = {}		#state of each worker process: the chains of every input file, the last snapshot of the complex and the log collector
+
+class Log_collector(logging.Handler):
+	"""This class keeps the level and message of the log records of a worker process, instead of writing them, so the main process can log them when it
+	uses the evaluation they belong to, see Worker_evaluator"""
+
+	def __init__(self):
+		logging.Handler.__init__(self)
+		self.records = []
+
+	def emit(self, record):
+		self.records.append((record.levelno, record.getMessage()))
+
+def Worker_initializer(files_chains, level):
+	"""This function initializes a worker process with the ID, fingerprint, radius of gyration and key atom coordinates of the chains of every input file.
+	The handlers of the log inherited from the main process are replaced by a Log_collector with its level, so the worker never writes the log file"""
+	worker_state["files"] = files_chains
+	worker_state["snapshot"] = None
+	worker_state["log"] = Log_collector()
+	worker_logger = logging.getLogger("macrocomplex.worker")		#a new process, no other job uses it
+	for handler in list(worker_logger.handlers):
+		worker_logger.removeHandler(handler)
+	worker_logger.addHandler(worker_state["log"])
+	worker_logger.setLevel(level)
+	worker_logger.propagate = False
+	Job_logger.current.set(worker_logger)		#the evaluations run in the same thread as the initializer
+
+def Worker_evaluator(sample, snapshot, excluded, rmsd_threshold, clashes_threshold, all_candidates = False):
+	"""This function evaluates a file against a snapshot of the complex in a worker process, see File_evaluator and Complex_snapshot. The complex is only
+	rebuilt from the shared memory when the snapshot changes. The log records of the evaluation are returned with it ("log"), as (level, message)"""
+	worker_state["log"].records = []
+	if worker_state["snapshot"] != snapshot["name"]:
+		shared_memory = multiprocessing.shared_memory.SharedMemory(name = snapshot["name"])
+		coords = numpy.ndarray((snapshot["atoms"], 3), dtype = float, buffer = shared_memory.buf).copy()
+		shared_memory.close()
+		ref_chains = []
+		spatial_index = SpatialIndex(5)
+		for chain_id, fingerprint, gyration, start, end in snapshot["chains"]:
+			ref_chains.append((chain_id, {"coords": coords[start:end], "fingerprint": fingerprint, "gyration": gyration}))
+			spatial_index.add(chain_id, coords[start:end])
+		worker_state["snapshot"] = snapshot["name"]
+		worker_state["complex"] = (ref_chains, spatial_index)
+	ref_chains, spatial_index = worker_state["complex"]
+	evaluation = File_evaluator(ref_chains, worker_state["files"][sample], spatial_index, excluded, rmsd_threshold, clashes_threshold, all_candidates)
+	evaluation["log"] = worker_state["log"].records
+	return evaluation
+
+def Worker_pool(structures, workers):
+	"""This function creates a pool of worker processes initialized with the chains of every input file and the level of the log, see Worker_initializer
+	and Worker_evaluator"""
+	files_chains = dict([(file, [(chain_id, {"coords": index["coords"], "fingerprint": index["fingerprint"], "gyration": index["gyration"]}) for chain_id, index in entry["index"]]) for file, entry in structures.items()])
+	return concurrent.futures.ProcessPoolExecutor(max_workers = workers, initializer = Worker_initializer, initargs = (files_chains, logger.getEffectiveLevel()))
+
+def Worker_log(evaluation):
+	"""This function logs in the main process the log records of an evaluation made by a worker process, see Worker_evaluator"""
+	for level, message in evaluation.get("log", []):
+		logger.log(level, message)
+
+def Building_iterator(macrocomplex, files_list, it, not_added, command_arguments, structures, spatial_index, interaction_graph, trajectory = None, metrics = None):
+	"""This generator runs the building process of the macrocomplex as a loop. In each iteration the first file of the list of files is processed (see
+	File_processor) and moved to the end of the list. The loop ends when the complex has the desired number of chains or when all the files have been
+	processed once without adding any chain to the complex. The state of the building process is yielded after every iteration, so it can be inspected
+	by the caller without keeping any object of the previous iterations.
+
+	If command_arguments.workers is greater than 1, the next files of the list are evaluated in advance by a pool of worker processes against a snapshot
+	of the complex in shared memory. The evaluations are used in the order of the list, and the ones made in advance are discarded as soon as a chain is
+	added to the complex, so the result is exactly the same as evaluating the files one after another
+
+	Arguments:
+
+	macrocomplex, files_list, it, not_added, command_arguments, structures, spatial_index, interaction_graph, trajectory and metrics are the same as in MacrocomplexBuilder
+
+	Yields:
+
+	state (dict): the state of the building process after one iteration: the number of the iteration ("iteration"), the processed file ("file"), the ID of
+	the chain added to the complex or None ("added_chain"), the list of IDs of the chains added to the complex ("added_chains"), the number of chains of the
+	complex ("chains") and the number of files processed since the last chain was added ("not_added")
+
+	"""
+	i = it 															#number of iterations
+	n = not_added													#number of files that have been parsed but no chain has been added
+	nc = command_arguments.number_chains							#number of chains		
+	workers = getattr(command_arguments, "workers", 1)
+	pool = shared_memory = None
+	evaluations = collections.deque()		#evaluations made in advance of the next files of the list
+	if workers > 1:
+		pool = Worker_pool(structures, workers)
+	try:
+		while True:
+			chains = len(macrocomplex)
+			### Prints the current iteration and number of chains of the current complex ###
+			logger.info("This is the iteration #%d of the building process" % i )
+			logger.info("The complex has %d chains at this point" % chains)
+			### Checks if the current macrocomplex satisfies the desired number of chains or if all the files have been processed without adding any chain ### 
+			if chains == nc or n > len(files_list): 
+				logger.info("The whole macrocomplex has been successfully build")
+				logger.info("The final complex has %d chains" % chains)
+				logger.info("We have arrived to iteration %d" %(i))
+				return 			#END OF THE BUILDING PROCESS
+			### Selects the file to analyze in this iteration. It is always the first element of the list of files because once analyzed it is substracted and appended at the end of the list ###
+			sample = files_list[0]
+			evaluation = None
+			if pool is not None:
+				## Sends the next files to the workers, evaluated against the current complex ##
+				if not evaluations:
+					if shared_memory is None:
+						shared_memory, snapshot = Complex_snapshot(macrocomplex)
+					for file in files_list[:workers * 2]:
+						if Pending_superimpositions(interaction_graph, file) == 0:		#this file will be skipped, there is nothing to evaluate
+							evaluations.append(None)
+						else:
+							evaluations.append(pool.submit(Worker_evaluator, file, snapshot, Rejected_superimpositions(interaction_graph, file), command_arguments.rmsd_threshold, command_arguments.clashes))
+				evaluation = evaluations.popleft()
+				if evaluation is not None:
+					evaluation = evaluation.result()
+			ID = File_processor(macrocomplex, sample, command_arguments, structures, spatial_index, interaction_graph, evaluation, trajectory, metrics)
+			if ID is not None and pool is not None:		#the complex has changed, so the evaluations made in advance are not valid anymore
+				if metrics is not None:
+					metrics.counters["discarded_evaluations"] += len([future for future in evaluations if future is not None])
+				for future in evaluations:
+					if future is not None:
+						future.cancel()
+				concurrent.futures.wait([future for future in evaluations if future is not None])		#the snapshot can only be removed when no worker is reading it
+				evaluations.clear()
+				shared_memory.close()
+				shared_memory.unlink()
+				shared_memory = None
+			file = files_list.pop(0)		#substracts the first file of the files list
+			files_list.append(file)			#adds the file at the end of the files list
+			i += 1							#adds one to the iteration variable
+			if ID is None:					#no chain has been added, adds one to the files that have not added chains
+				n += 1
+			else:
+				n = 0
+			if metrics is not None:
+				metrics.iteration()
+			yield {"iteration": i, "file": sample, "added_chain": ID, "added_chains": [ID] if ID is not None else [], "chains": len(macrocomplex), "not_added": n}
+	finally:
+		if pool is not None:
+			pool.shutdown(cancel_futures = True)
+		if shared_memory is not None:
+			shared_memory.close()
+			shared_memory.unlink()
+
+def Batch_building_iterator(macrocomplex, files_list, it, command_arguments, structures, spatial_index, interaction_graph, trajectory = None, metrics = None):
+	"""This generator runs the building process of the macrocomplex in passes. In each pass, every file of the list of files is evaluated against the
+	complex as it was at the beginning of the pass (see File_evaluator), and all the rotated chains that do not clash with the complex are collected.
+	The collected chains are checked in order against the ones already kept in the same pass with a second spatial index, so a chain placed twice by
+	different files is only added once, and then all of them are added to the complex together. The loop ends when the complex has the desired number
+	of chains or when a whole pass does not add any chain. This way, symmetric complexes grow in a few passes instead of one chain per iteration.
+
+	If command_arguments.workers is greater than 1, the files of each pass are evaluated by a pool of worker processes, see Building_iterator
+
+	Arguments:
+
+	macrocomplex, files_list, it, command_arguments, structures, spatial_index, interaction_graph, trajectory and metrics are the same as in MacrocomplexBuilder
+
+	Yields:
+
+	state (dict): the state of the building process after one pass, with the same keys as in Building_iterator. The processed file ("file") is None and
+	the ID of the added chain ("added_chain") is the last one added in the pass
+
+	"""
+	i = it 															#number of passes
+	nc = command_arguments.number_chains							#number of chains
+	clashes_threshold = command_arguments.clashes 					#clashes threshold
+	workers = getattr(command_arguments, "workers", 1)
+	pool = Worker_pool(structures, workers) if workers > 1 else None
+	try:
+		while True:
+			complex_chains = len(macrocomplex)
+			### Prints the current pass and number of chains of the current complex ###
+			logger.info("This is the pass #%d of the building process" % i )
+			logger.info("The complex has %d chains at this point" % complex_chains)
+			if complex_chains == nc:
+				break
+			### Evaluates all the files against the current complex ###
+			files = [file for file in files_list if Pending_superimpositions(interaction_graph, file) > 0]		#the files that cannot extend the complex are skipped
+			if metrics is not None:
+				for file in set(files_list) - set(files):
+					metrics.skipped(file)
+			if pool is not None:
+				shared_memory, snapshot = Complex_snapshot(macrocomplex)
+				try:
+					evaluations = list(pool.map(Worker_evaluator, files, [snapshot] * len(files), [Rejected_superimpositions(interaction_graph, file) for file in files], [command_arguments.rmsd_threshold] * len(files), [clashes_threshold] * len(files), [True] * len(files)))
+				finally:
+					shared_memory.close()
+					shared_memory.unlink()
+				for evaluation in evaluations:		#in the order of the files, as if they had been evaluated here
+					Worker_log(evaluation)
+			else:
+				ref_chains = [(record["id"], record["index"]) for record in macrocomplex]
+				evaluations = [File_evaluator(ref_chains, structures[file]["index"], spatial_index, Rejected_superimpositions(interaction_graph, file), command_arguments.rmsd_threshold, clashes_threshold, True) for file in files]
+			### Deduplicates the collected chains against each other, with a spatial index of the chains kept in this pass ###
+			batch_index = SpatialIndex(spatial_index.radius)
+			batch = []
+			for file, evaluation in zip(files, evaluations):
+				if metrics is not None:
+					metrics.evaluated(file, evaluation)
+				for chains in evaluation["rejected"]:		#the complex only grows, so the rejected superimpositions will always be rejected
+					Superimposition_rejector(interaction_graph, file, chains[1], chains[0])
+				for candidate in evaluation["candidates"]:
+					if complex_chains + len(batch) == nc:		#the complex would have the desired number of chains
+						break
+					if batch and max(batch_index.contacts(candidate["coords"])) > clashes_threshold:		#the chain is already kept, or clashes with a kept chain, which will be in the complex
+						Superimposition_rejector(interaction_graph, file, candidate["chains"][1], candidate["chains"][0])
+						if metrics is not None:
+							metrics.counters["duplicate_rejections"] += 1
+						continue
+					batch_index.add(len(batch), candidate["coords"])
+					batch.append((file, candidate))
+			### Adds all the kept chains to the complex ###
+			added_chains = []
+			for file, candidate in batch:
+				start = timeit.default_timer()
+				added_chains.append(Chain_placer(macrocomplex, file, candidate, structures, spatial_index, interaction_graph, trajectory))
+				if metrics is not None:
+					metrics.added(file, timeit.default_timer() - start)
+			i += 1
+			if metrics is not None:
+				metrics.iteration()		#each pass is an iteration
+			logger.info("%d chains have been added in this pass" % len(added_chains))
+			yield {"iteration": i, "file": None, "added_chain": added_chains[-1] if added_chains else None, "added_chains": added_chains, "chains": len(macrocomplex), "not_added": 0 if added_chains else len(files_list)}
+			if not added_chains:
+				break
+		logger.info("The whole macrocomplex has been successfully build")
+		logger.info("The final complex has %d chains" % len(macrocomplex))
+		logger.info("We have arrived to pass %d" %(i))
+	finally:
+		if pool is not None:
+			pool.shutdown(cancel_futures = True)
+
+class Symmetry_expander(object):
+	"""This class adds the symmetric copies of the chains of the complex. Homo-oligomeric complexes, like viral capsids, repeat the same few
+	superimpositions hundreds of times, so when a superimposition places a chain of the same type as the chain of the complex it was superimposed onto,
+	the transformation between both chains is taken as a generator of the point group of the complex (cyclic, dihedral, tetrahedral, octahedral or
+	icosahedral). The whole group is obtained by composing the generators until no new operation appears (see closure and symmetrize), and the copies of
+	the chains of the complex under all the operations of the group are checked against the complex with a single query to the spatial index for each chain (see
+	copies). A generator is only used if it generates a finite group and none of the copies of the complex clashes with a chain it is not a copy of,
+	otherwise it is not a symmetry of the complex and the building process goes on without it
+
+	Arguments:
+
+	rmsd_threshold (float): the RMSD threshold, the transformations between two chains with a higher RMSD are not used as generators
+
+	clashes_threshold (int): the clashes threshold, a copy with more clashes with a chain of the complex is considered to be that chain
+
+	max_order (int): the maximum number of operations of the group, it is the desired number of chains of the complex
+
+	tolerance (float): two operations are the same if they place the same chain with an RMSD below this value. By default 5, the clashes distance, as the
+	errors of the generators add up when they are composed, while different operations place the chain far away
+
+	"""
+	def __init__(self, rmsd_threshold, clashes_threshold, max_order, tolerance = 5):
+		self.rmsd_threshold = rmsd_threshold
+		self.clashes_threshold = clashes_threshold
+		self.max_order = max_order
+		self.tolerance = tolerance
+		self.probe = None			#key atom coordinates placed by every operation to compare them, some of the first chain of the complex
+		self.generators = []		#the generators of the group, as tuples of ROTATION matrix, TRANSLATION vector and RMSD
+		self.rejected = []			#the transformations that are not symmetries of the complex
+		self.group = [(numpy.identity(3), numpy.zeros(3), 0.0)]		#the operations of the group, the first one is the identity
+
+	def operation(self, macrocomplex, chains, record):
+		"""Returns the ID of the chain of the complex the chain of a record was superimposed onto (or of the first chain of its type, for the chains of
+		the initial complex) and the transformation that places it on the chain of the record, as a tuple of ROTATION matrix, TRANSLATION vector and
+		RMSD, or None if they are not of the same type"""
+		fingerprint = record["index"]["fingerprint"]
+		if record["sample_chain"] == "*":		#a copy, its transformation is already an operation of the group
+			return None
+		elif record["ref_chain"] == ".":
+			reference = [other for other in macrocomplex if other["ref_chain"] == "." and other["index"]["fingerprint"] == fingerprint][0]
+		else:
+			reference = chains[record["ref_chain"]]
+		if reference is record or reference["index"]["fingerprint"] != fingerprint:
+			return None
+		RMSDs, rotations, translations = Kabsch_superimposer(record["index"]["coords"][None], reference["index"]["coords"])
+		return reference["id"], (rotations[0], translations[0], float(RMSDs[0]))
+
+	def find(self, operation, operations):
+		"""Returns the position of an operation in a list of operations, or None if it is not in it"""
+		if not operations:
+			return None
+		images = numpy.array([numpy.dot(self.probe, rotation) + translation for rotation, translation, rmsd in operations])
+		deviations = numpy.sqrt(((images - (numpy.dot(self.probe, operation[0]) + operation[1])) ** 2).sum(axis = 2).mean(axis = 1))
+		position = int(deviations.argmin())
+		return position if deviations[position] <= self.tolerance else None
+
+	def closure(self, generators):
+		"""Returns all the operations of the group generated by the given generators, composing every operation found with every generator until no new
+		operation appears, or None if there are more than max_order operations, then the generators are not symmetries of a point group. The RMSD of
+		each operation is the sum of the RMSDs of the generators composed"""
+		group = [(numpy.identity(3), numpy.zeros(3), 0.0)]
+		position = 0
+		while position < len(group):
+			rotation, translation, rmsd = group[position]
+			position += 1
+			for generator in generators:
+				product = (numpy.dot(rotation, generator[0]), numpy.dot(translation, generator[0]) + generator[1], rmsd + generator[2])		#the operation followed by the generator
+				if self.find(product, group) is not None:
+					continue
+				if len(group) == self.max_order:
+					return None
+				group.append(product)
+		return self.symmetrize(group)
+
+	def symmetrize(self, group):
+		"""Returns the operations of the group corrected so they form an exact group, otherwise the errors of the generators add up along the compositions.
+		The rotation of every operation is replaced by the average of the rotations that take every other operation to its product with it, and the
+		translations are set so all the operations leave the center of the group, the centroid of the copies of any point, in place"""
+		rotations = numpy.array([rotation for rotation, translation, rmsd in group])
+		translations = numpy.array([translation for rotation, translation, rmsd in group])
+		images = numpy.matmul(self.probe, rotations) + translations[:, None, :]
+		table = numpy.empty((len(group), len(group)), dtype = int)		#the position in the group of the product of every pair of operations
+		for position, (rotation, translation, rmsd) in enumerate(group):
+			products = numpy.dot(images, rotation) + translation
+			table[:, position] = ((products[:, None] - images[None]) ** 2).sum(axis = 3).mean(axis = 2).argmin(axis = 1)
+		if any(len(set(row)) != len(group) for row in table):		#not a group table, the operations are kept as they are
+			return group
+		for iteration in range(3):
+			u, d, vt = numpy.linalg.svd(numpy.einsum("iba,ijbc->jac", rotations, rotations[table]) / len(group))
+			rotations = numpy.matmul(u, vt)		#the closest rotation to the average
+		center = images.mean(axis = (0, 1))
+		return [(rotation, center - numpy.dot(center, rotation), rmsd) for rotation, (old_rotation, translation, rmsd) in zip(rotations, group)]
+
+	def point_group(self, group):
+		"""Returns the name of a point group from its order and the highest order of its rotations: Cn, Dn, T, O or I"""
+		angles = [numpy.arccos(numpy.clip((numpy.trace(rotation) - 1) / 2, -1, 1)) for rotation, translation, rmsd in group[1:]]
+		folds = max([int(round(2 * numpy.pi / angle)) for angle in angles if angle > 1e-3] + [1])
+		if len(group) == folds:
+			return "C%d" % folds
+		elif len(group) == 2 * folds:
+			return "D%d" % folds
+		return {12: "T", 24: "O", 60: "I"}.get(len(group), "of order %d" % len(group))
+
+	def copies(self, macrocomplex, group, records, structures, spatial_index):
+		"""Returns the copies of the chains of the given records under all the operations of the group that are not in the complex yet. All the copies
+		of a chain are checked against the complex with a single query to the spatial index (see SpatialIndex.contacts), and against the copies kept
+		before with a second spatial index. A copy with more clashes than the threshold with a chain must be a copy of that chain, i.e., of its same type
+		and placed at less than the tolerance from it, then it is not kept and that chain is not copied again
+
+		Arguments:
+
+		macrocomplex (list): the records of the chains of the complex, see Complex_initializer
+
+		group (list): the operations of the group, as returned by closure
+
+		records (list): the records of the chains to copy
+
+		structures and spatial_index are the same as in File_processor
+
+		Returns:
+
+		copies (list): the copies to add to the complex, as dictionaries with the file the chain comes from ("file") and the same keys as the accepted
+		superimpositions of File_evaluator, the chain copied and "*" as the reference and sample chain IDs ("chains")
+
+		inconsistent (int): the number of copies that clash with a chain they are not a copy of
+
+		"""
+		chains = dict([(record["id"], record["index"]) for record in macrocomplex])
+		batch_index = SpatialIndex(spatial_index.radius)		#the copies kept, labelled by their position in copies
+		copies = []
+		copied = set()		#the chains of the complex that are copies of a chain already copied
+		inconsistent = 0
+		for record in records:
+			if record["id"] in copied:
+				continue
+			copied.add(record["id"])
+			coords = dict(structures[record["file"]]["index"])[record["source_chain"]]["coords"]
+			transforms = [(numpy.dot(record["rotation"], rotation), numpy.dot(record["translation"], rotation) + translation, rmsd) for rotation, translation, rmsd in group[1:]]
+			images = numpy.array([numpy.dot(coords, rotation) + translation for rotation, translation, rmsd in transforms])		#the same operation as in File_evaluator
+			groups = numpy.repeat(numpy.arange(len(images)), len(coords))
+			all_clashes = spatial_index.contacts(images.reshape(-1, 3), groups)		#all the copies of the chain at once
+			batch_clashes = batch_index.contacts(images.reshape(-1, 3), groups) if copies else numpy.zeros((len(images), 0), dtype = int)
+			for clashes, kept_clashes, (rotation, translation, rmsd), image in zip(all_clashes, batch_clashes, transforms, images):
+				if len(clashes) and clashes.max() > self.clashes_threshold:
+					chain_id = spatial_index.labels[clashes.argmax()]
+					other = chains[chain_id]
+				elif len(kept_clashes) and kept_clashes.max() > self.clashes_threshold:
+					chain_id = None
+					other = {"fingerprint": copies[kept_clashes.argmax()]["fingerprint"], "coords": copies[kept_clashes.argmax()]["coords"]}
+				else:		#a new chain
+					batch_index.add(len(copies), image)
+					copies.append({"file": record["file"], "chains": (record["id"], "*"), "chain_to_add": record["source_chain"], "rmsd": rmsd, "rotation": rotation,
+									"translation": translation, "coords": image, "fingerprint": record["index"]["fingerprint"]})
+					continue
+				if other["fingerprint"] != record["index"]["fingerprint"] or numpy.sqrt(((other["coords"] - image) ** 2).sum(axis = 1).mean()) > self.tolerance:
+					logger.debug("The symmetric copy of chain %s clashes with a chain it is not a copy of" % record["id"])
+					inconsistent += 1
+				elif chain_id is not None:
+					copied.add(chain_id)
+		return copies, inconsistent
+
+	def expand(self, macrocomplex, records, structures, spatial_index, interaction_graph, trajectory = None, metrics = None):
+		"""Looks for new generators in the records of the chains just added to the complex and adds the copies of the chains of the complex under the
+		group to it. If the group has changed, all the chains of the complex are copied, otherwise only the chains of the records
+
+		Arguments:
+
+		macrocomplex (list): the records of the chains of the complex, see Complex_initializer
+
+		records (list): the records of the chains just added to the complex, or of all its chains when the building process starts
+
+		structures, spatial_index, interaction_graph, trajectory and metrics are the same as in File_processor, and are updated with the added chains
+
+		Returns:
+
+		added_chains (list): the IDs of the copies added to the complex
+
+		"""
+		if self.probe is None:
+			self.probe = macrocomplex[0]["index"]["coords"][::max(len(macrocomplex[0]["index"]["coords"]) // 20, 1)]		#a few atoms along the chain
+		chains = dict([(record["id"], record) for record in macrocomplex])
+		for record in list(records):
+			found = self.operation(macrocomplex, chains, record)
+			if found is None or found[1][2] > self.rmsd_threshold:
+				continue
+			reference, operation = found
+			if self.find(operation, self.group) is not None or self.find(operation, self.rejected) is not None:		#already known
+				continue
+			group = self.closure(self.generators + [operation])
+			if group is None:
+				logger.info("The transformation between chain %s and chain %s does not generate a point group of %d operations at most" % (reference, record["id"], self.max_order))
+				self.rejected.append(operation)
+				continue
+			copies, inconsistent = self.copies(macrocomplex, group, macrocomplex, structures, spatial_index)
+			if inconsistent:
+				logger.info("The transformation between chain %s and chain %s is not a symmetry of the complex, %d copies clash with other chains" % (reference, record["id"], inconsistent))
+				self.rejected.append(operation)
+				continue
+			self.generators.append(operation)
+			self.group = group
+			records = macrocomplex		#all the chains of the complex are copied under the new group
+			logger.info("The transformation between chain %s and chain %s generates the point group %s, with %d operations" % (reference, record["id"], self.point_group(group), len(group)))
+			if metrics is not None:
+				metrics.counters["symmetry_generators"] += 1
+		if len(self.group) == 1:
+			return []
+		copies, inconsistent = self.copies(macrocomplex, self.group, list(records), structures, spatial_index)
+		if inconsistent:
+			logger.warning("%d symmetric copies clash with chains they are not a copy of, they are not added" % inconsistent)
+		added_chains = []
+		for copy in copies[:max(self.max_order - len(macrocomplex), 0)]:		#the complex would have the desired number of chains
+			start = timeit.default_timer()
+			added_chains.append(Chain_placer(macrocomplex, copy["file"], copy, structures, spatial_index, interaction_graph, trajectory))
+			if metrics is not None:
+				metrics.counters["symmetry_copies"] += 1
+				metrics.added(copy["file"], timeit.default_timer() - start)
+		if added_chains:
+			logger.info("%d symmetric copies have been added to the complex" % len(added_chains))
+		return added_chains
+
+def MacrocomplexBuilder(macrocomplex, files_list, it, not_added, command_arguments, structures, spatial_index, interaction_graph, trajectory = None, metrics = None):
+	"""This function superimposes the most similar chain of each binary interaction PDB file with a reference structure and adds the transformed chain to the
+	building complex, iteration after iteration, until the complex is finished. See Building_iterator and File_processor
+
+	Arguments:
+
+	macrocomplex (list): the records of the chains of the complex, which is gonna get build on every iteration of the function, see Complex_initializer.
+	The atoms of the chains are not copied nor moved while the complex is being built, see Complex_materializer
 
 	files_list (list): a list containing all the pdb files of binary interactions between the different subunits or chains that form the complex
 
-	it (int): this is a counter that keeps track of the interaction of the iterative function
+	it (int): this is a counter that keeps track of the iteration of the building process
 
 	not_added (int): this is a counter that keeps track of the files that have been parsed but no chains were added to the complex
 
@@ -179,117 +1743,183 @@ def MacrocomplexBuilder(ref_structure, files_list, it, not_added, command_argume
 
 			outdir(str): this is the output directory relative path
 
-			iterations(boolean): this is set True if the user wants a pdb file for each iteration of the complex. Otherwise is False
+			pdb_iterations(boolean): this is set True if the user wants the building steps of the complex to be saved, see Trajectory_writer. Otherwise is False
+
+			workers(int): number of worker processes used to evaluate the files in advance, see Building_iterator. By default 1, no worker processes
+
+			checkpoint_interval(int): the state of the building process is saved in macrocomplex_checkpoint.json, in the output directory, every this number
+			of iterations, see Checkpoint_writer. The file is removed once the final complex has been written. By default 0, never
+
+			batch(boolean): this is set True if the user wants to add all the chains that do not clash with the complex in each pass, see Batch_building_iterator
+
+			symmetry(boolean): this is set True if the user wants the symmetric copies of the chains to be added as soon as a symmetry of the complex is found,
+			see Symmetry_expander
+
+	structures (dict): dictionary of preloaded structures of all the files in files_list, as returned by Structures_loader
 
-	It is an iterative function, it calls itself until certain condition is met, then:
+	spatial_index (SpatialIndex): grid containing the key atoms of all the chains of the complex, labelled by their chain IDs
+
+	interaction_graph (dict): the interaction graph of the input files and the complex, as returned by Interaction_graph. Only the files that share a
+	chain type with the complex, and that have not been rejected with all the chains of that type, are superimposed
+
+	trajectory (Trajectory_writer): the writer of the building steps, every added chain is sent to it. By default None, the steps are not saved
+
+	metrics (Metrics): the counters and timers of the building process, see Metrics. By default None, nothing is counted
 
 	Returns:
 
-	ref_structure (Bio.PDB.Structure): pdb structure instance containing all chains of the final macrocomplex.
+	macrocomplex (list): the records of all chains of the final macrocomplex.
 
 	"""
-
-	### Saving arguments passed on to the function ###
-	i = it 															#number of iterations
-	n = not_added													#number of files that have been parsed but no chain has been added
-	nc = command_arguments.number_chains							#number of chains		
-	clashes_threshold = command_arguments.clashes 					#clashes threshold
-	RMSD_threshold = command_arguments.rmsd_threshold 				#RMSD threshold
-	indir = command_arguments.indir 								#input directory relative path
-	outdir = command_arguments.outdir 								#output directory relative path
-	pdb_iterations = command_arguments.pdb_iterations 				#if True, each iteration is stored in a pdb file
-
-	chains = ref_structure[0].__len__()
-	### Prints the current iteration and number of chains of the current complex ###
-	logging.info("This is the iteration #%d of the recursive function" % i )
-	logging.info("The complex has %d chains at this point" % chains)
-
-	### Checks if the current macrocomplex satisfies the desired number of chains or just stops at iteration 150 ### 
-	if chains == nc or n > len(files_list): 
-		logging.info("The whole macrocomplex has been successfully build")
-		logging.info("The final complex has %d chains" % chains)
-		logging.info("We have arrived to iteration %d" %(i))
-		return 	ref_structure			#END OF THE RECURSIVE FUNCTION
-
-	### Selects the file to analyze in this iteration. It is always the first element of the list of files because once analyzed it is substracted and appended at the end of the list ###
-	sample = files_list[0]		#saves the first file name of the list of files as the sample
-	logging.info("We are processing the file %s" % (sample))
-	file_path = indir + "/" + sample 			#takes the path of the sample file
-	pdb_parser = Bio.PDB.PDBParser(QUIET = True)		#parses the sample PDB file and creates a sample PDBParser object
-	sample_structure = pdb_parser.get_structure("sample", file_path)		#saves the Structure object of the sample PDBParser object
-	sample_model = sample_structure[0]		#obtains the first and only available model of the sample structure 
-	### Calling the superimposition function to obtain the superimposition of every combination of pairs of chains between the reference and sample structures
-	all_superimpositions, superimposed_chains, best_RMSD = superimposition(ref_structure, sample_structure, RMSD_threshold)
-
-	### There are no superimposed chains or RMSD is above the threshold --> Call again the recursive function ###
-	if superimposed_chains is False or best_RMSD > RMSD_threshold:		#if condition is met, there are no superimposed chains, or the RMSD is not small enough to be considered
-		file = files_list.pop(0)		#substracts the current file
-		files_list.append(file)			#and adds it at the end of the list of files
-		i += 1							#calling again the recursive function to analyze the next file
-		n += 1
-		return MacrocomplexBuilder(ref_structure = ref_structure, files_list = files_list, it = i, not_added = n, command_arguments = command_arguments)	#call again the iterative function, j does not change
-	### There are superimposed chains ###
+	if getattr(command_arguments, "batch", False):
+		iterator = Batch_building_iterator(macrocomplex, files_list, it, command_arguments, structures, spatial_index, interaction_graph, trajectory, metrics)
 	else:
-		## Loops through the superimposition dictionary, obtaining the superimposition instances and the reference and sample IDs ##
-		for chains, sup in all_superimpositions:
-			logging.info("We are processing the superimposition of ref chain %s with sample chain %s with an RMSD of %f" % (chains[0],chains[1], sup.rms))
-			if sup.rms > RMSD_threshold:			#Checks that the superimposition has an RMSD above the threshold
-				logging.info("This superimposition of ref chain %s with sample chain %s has an RMSD bigger than the threshold, therefore it is skipped" % (chains[0],chains[1]))
-				continue							#if not, skip that superimposition
-			sup.apply(sample_model.get_atoms())		#applies ROTATION and TRANSLATION matrices to all the atoms in the sample model
-			## Gets the sample chain that was not superimposed with the reference chain --> putative chain to add ##
-			chain_to_add = [chain for chain in sample_model.get_chains() if chain.get_id() != chains[0]][0]		
-			present_chain = False		#this variable indicates whether the chain to add is present on the building complex or not: False => not present, True => present
-			sample_atoms, sample_molecule = Key_atom_retriever(chain_to_add)		#retrieves all key atoms (CA or C4') and molecule type of chain_to_add
-			logging.info("Putative chain to add is %s" % chain_to_add.id)
-			## Loops through all the chains from the reference structure ##
-			for chain in ref_structure[0].get_chains():					
-				ref_atoms, ref_molecule = Key_atom_retriever(chain)		#retrieves all key atoms (CA or C4') and molecule type of the reference present chain
-				## Makes a Neighbor Search to look for clashes between the chain to add and the chains from the reference structure ##
-				Neighbor = Bio.PDB.NeighborSearch(ref_atoms)			#creates an instance of class NeighborSearch, given a list of reference atoms 
-				clashes = []		#declares a list that will contain all the atoms that clash between the reference and sample chains
-				for atom in sample_atoms:								#loops through the list of atoms of chain_to_add
-					atoms_clashed = Neighbor.search(atom.coord,5)		#produces a Neighbor search that returns all atoms/residues/chains/models/structures that have at least one atom within radius of center. 
-					if len(atoms_clashed) > 0:				#if there are clashes
-						clashes.extend(atoms_clashed)		#adds the atoms list to the list of clashes
-				if len(clashes) > clashes_threshold:		#checks that the number of total clashes is above the threshold
-					present_chain = True					#then, chain_to_add is considered a chain already present in the complex
-					logging.info("The number of clashes between the chain to add %s and reference chain %s is %d, therefore the chain is skipped" % (chain_to_add.id, chain.id,len(clashes)))
-					break 									#skips continuing through the loop, as it already clashes with one reference chain
-				## Checks that the number of total clashes is under the threshold ##
-				elif len(clashes) <= clashes_threshold:		
-					logging.info("The number of clashes between the chain to add %s and reference chain %s is %d, it is under the threshold" % (chain_to_add.id, chain.id,len(clashes)))
-					continue								#continue the loops, as we must ensure that chain_to_add does not clash with ANY reference chain 	
-			## Rotated chain to add is not a chain already in the building macrocomplex structure, then adds it, with its original ID or with a new one ##
-			if present_chain is False:						
-				logging.info("Chain %s superimposed with chain %s yields rotated chain %s which is not in the complex" %(chains[0],chains[1],chain_to_add.id))
-				chain_ids = [chain.id for chain in ref_structure[0].get_chains()]	#list containing IDs of all chains present in reference structure
-				ID = ID_creator(chain_ids, chain_to_add.id)
-				chain_to_add.id = ID
-				ref_structure[0].add(chain_to_add)	#adds chain_to_add to the building macrocomplex structure
-				logging.info("Added Chain %s" % ID)
-				## Checks whether the user provided the iterations argument, then save each iteration of the current complex in a PDB file ##
-				if pdb_iterations:
-					if len(list(ref_structure[0].get_atoms())) > 99999 or len(list(ref_structure[0].get_chains())) > 62:		#checks that the structure has has less atoms than the maximum for a PDB, 99,999
-						io = Bio.PDB.MMCIFIO()								#creates the MMCIFIO object, that can contain more than 99,999 atom coordinates
-						io.set_structure(ref_structure[0])					#sets the reference structure object to be written in a MMCIF file
-						io.save("macrocomplex_chains_%d.cif" %(ref_structure[0].__len__()))	#saves the structure on a file
-						logging.info("saving macrocomplex_chains_%d.cif in %s" %(ref_structure[0].__len__(),os.path.abspath(outdir)))
-					else: 													#checks that the structure has more than 99,999 atoms
-						io = Bio.PDB.PDBIO()								#creates the PDBIO object
-						io.set_structure(ref_structure[0])					#sets the reference structure object to be written in a PDB file
-						io.save("macrocomplex_chains_%d.pdb" %(ref_structure[0].__len__()))	#saves the structure on a file
-						logging.info("saving macrocomplex_chains_%d.pdb in %s" %(ref_structure[0].__len__(),os.path.abspath(outdir)))
-				file = files_list.pop(0)		#substracts the first file of the files list
-				files_list.append(file)			#adds the file at the end of the files list
-				i += 1							#adds one to the iteration variable
-				n = 0
-				#this is what makes the function recursive, it calls itself on the return, executing the whole function again and again until certain condition is met
-				return MacrocomplexBuilder(ref_structure = ref_structure, files_list = files_list, it = i, not_added = n, command_arguments = command_arguments)
-	### Once the current file has been analyzed it is substracted and appended at the end of the files list ###
-	file = files_list.pop(0)		#substracts the first file of the files list
-	files_list.append(file)			#adds the file at the end of the files list
-	i += 1							#adds one to the iteration variable
-	n += 1
-	#this is what makes the function recursive, it calls itself on the return, executing the whole function again and again until certain condition is met
-	return MacrocomplexBuilder(ref_structure = ref_structure, files_list = files_list, it = i, not_added = n, command_arguments = command_arguments)		
+		iterator = Building_iterator(macrocomplex, files_list, it, not_added, command_arguments, structures, spatial_index, interaction_graph, trajectory, metrics)
+	symmetry = None
+	if getattr(command_arguments, "symmetry", False):
+		symmetry = Symmetry_expander(command_arguments.rmsd_threshold, command_arguments.clashes, command_arguments.number_chains)
+		symmetry.expand(macrocomplex, list(macrocomplex), structures, spatial_index, interaction_graph, trajectory, metrics)		#the initial complex, or the one of a checkpoint
+	checkpoint_interval = getattr(command_arguments, "checkpoint_interval", 0)
+	for state in iterator:
+		if symmetry is not None and state["added_chains"]:		#the chains just added are the last ones of the complex
+			symmetry.expand(macrocomplex, macrocomplex[-len(state["added_chains"]):], structures, spatial_index, interaction_graph, trajectory, metrics)
+		if checkpoint_interval and state["iteration"] % checkpoint_interval == 0:		#the state is consistent between iterations
+			Checkpoint_writer(os.path.join(command_arguments.outdir, "macrocomplex_checkpoint.json"), macrocomplex, files_list, state["iteration"], state["not_added"], interaction_graph, command_arguments)
+	return macrocomplex
+
+job_defaults = {"number_chains": 100, "rmsd_threshold": 0.3, "clashes": 30, "cache_dir": None, "batch": False, "symmetry": False, "workers": 1,
+				"checkpoint_interval": 0, "resume": False, "pdb_iterations": False, "metrics": False, "metrics_interval": 0, "debug": False, "verbose": False}		#the arguments of a job that may be missing, see Macrocomplex_job
+
+def Macrocomplex_job(command_arguments, files_list = None, structures = None):
+	"""This function runs the whole building process of a complex: it loads the input files, creates the initial complex or resumes it from the last
+	checkpoint, builds it with MacrocomplexBuilder and writes the final complex, the log and the rest of output files in the output directory. It does not
+	change the working directory, and the log is only written by the handlers of a logger of its own ("macrocomplex." and the output directory) set
+	while the job runs, so several complexes can be built one after another by the same program, at the same time by different threads of a program, or
+	by different processes, see Job_logger and macrocomplex_batch.py
+
+	Arguments:
+
+	command_arguments(argparse object): is the object containing all the command-line arguments, see MacrocomplexBuilder. Only indir and outdir are
+	required, the missing ones take the same default values as in macrocomplex_builder.py (see job_defaults), except checkpoint_interval, 0. Also contains:
+
+			indir(str): this is the input directory absolute path
+
+			outdir(str): this is the output directory absolute path, it must exist
+
+			cache_dir(str): folder of the parsed input files, see Structure_parser. None if they are not cached
+
+			resume(boolean): this is set True if the building process has to be resumed from the checkpoint of the output directory, see Checkpoint_reader
+
+			metrics(boolean): this is set True if the metrics have to be saved in the output directory, see Metrics
+
+			metrics_interval(int): a summary of the metrics is logged every this number of iterations, see Metrics
+
+			debug(boolean): this is set True if the superimpositions and clashes of every pair of chains have to be logged
+
+			verbose(boolean): this is set True if the log has to be printed in standard output too
+
+	files_list (list): the PDB files of the input directory to use, in the order they are processed, which is not modified. By default None, all of them,
+	see Input_files_finder
+
+	structures (dict): the preloaded structures of files_list, as returned by Structures_loader, which are not modified by the job. By default None, the
+	files are loaded by the job
+
+	Returns:
+
+	result (dict): contains the records of the chains of the final complex ("macrocomplex"), the path of the output file ("output") and the seconds the
+	job took ("time")
+
+	"""
+	start = timeit.default_timer()
+	command_arguments = argparse.Namespace(**dict(job_defaults, **vars(command_arguments)))		#a copy, with the missing arguments
+	outdir = command_arguments.outdir
+	if files_list is None:
+		files_list = Input_files_finder(command_arguments.indir)
+	files_list = list(files_list)		#the files are reordered while the complex is built, see Building_iterator
+
+	### Initializing the LOG of the job ###
+	handlers = [logging.FileHandler(os.path.join(outdir, "macrocomplex.log"))]		# The LOG file is "macrocomplex.log" by default
+	handlers[0].setFormatter(logging.Formatter('%(levelname)s:%(message)s'))
+	if command_arguments.verbose:		# Checking if VERBOSE argument is set
+		handlers.append(logging.StreamHandler())		# If it is set, the LOG file is also printed in STDOUT
+	job_logger = logging.getLogger("macrocomplex.%s" % os.path.abspath(outdir))		#only this job writes in its output directory
+	level, propagate = job_logger.level, job_logger.propagate
+	job_logger.setLevel(logging.DEBUG if command_arguments.debug else logging.INFO)
+	job_logger.propagate = False		#the log of the job is not mixed with the one of the program running it, nor with other jobs
+	for handler in handlers:
+		job_logger.addHandler(handler)
+	token = Job_logger.current.set(job_logger)		#the messages of logger in this thread go to the job from now on
+	try:
+		logger.debug('...STARTING...')
+		logger.info("Parameters used are:\n  - Number of chains: %d\n  - RMSD threshold: %.4f\n  - Clashes threshold %d" % (command_arguments.number_chains, command_arguments.rmsd_threshold, command_arguments.clashes))
+
+		### Parsing all the input files only once ###
+		if structures is None:
+			structures = Structures_loader(command_arguments.indir, files_list, command_arguments.cache_dir)		#all the files are parsed here and reused in every iteration
+
+		### Using the first file as the reference for the macrocomplex ###
+		it = 0				#iterations of the building process
+		not_added = 0		#files processed since the last chain was added
+		if command_arguments.resume:		# Checking if the building process has to be resumed from the last checkpoint, see Checkpoint_writer
+			checkpoint_path = os.path.join(outdir, "macrocomplex_checkpoint.json")
+			if not os.path.exists(checkpoint_path):
+				raise NameError("ERROR! There is no checkpoint to resume in the output folder!")
+			checkpoint = Checkpoint_reader(checkpoint_path, structures)
+			if checkpoint["files"] != sorted(files_list) or checkpoint["rmsd_threshold"] != command_arguments.rmsd_threshold or checkpoint["clashes"] != command_arguments.clashes or checkpoint["batch"] != command_arguments.batch or checkpoint["symmetry"] != command_arguments.symmetry:
+				raise NameError("ERROR! The checkpoint was saved with different input files or parameters, the building process cannot be resumed!")
+			macrocomplex = checkpoint["macrocomplex"]		#the complex, the order of the files and the counters are the same as when the checkpoint was saved
+			files_list = checkpoint["files_list"]
+			it = checkpoint["it"]
+			not_added = checkpoint["not_added"]
+			logger.info("The building process is resumed from the checkpoint of iteration %d" % it)
+		else:
+			macrocomplex = Complex_initializer(structures, files_list[0])	#creation of the initial complex with the chains of the first file
+		spatial_index = SpatialIndex(5)		#grid of the key atoms of the complex, used to look for clashes within 5 angstroms
+		for record in macrocomplex:
+			spatial_index.add(record["id"], record["index"]["coords"])
+		interaction_graph = Interaction_graph(structures, macrocomplex)		#graph of the chain types of the input files and the complex
+		if command_arguments.resume:		#the superimpositions rejected before the checkpoint will always be rejected
+			for file, chain_id, ref_chain_ids in checkpoint["rejected"]:
+				for ref_chain_id in ref_chain_ids:
+					Superimposition_rejector(interaction_graph, file, chain_id, ref_chain_id)
+		logger.info("The initial complex has %d chains and are the following:" % (len(macrocomplex)))
+		for ID in [record["id"] for record in macrocomplex]:		#loops through all chains of the initial complex
+			logger.info("Chain %s", ID)		#prints the ID
+
+		metrics = Metrics(command_arguments.metrics_interval)		#counters and timers of the building process, see Metrics
+		trajectory = None
+		if command_arguments.pdb_iterations:		#the building steps are saved by a background thread, see Trajectory_writer
+			trajectory = Trajectory_writer(structures, outdir)
+			trajectory.start(macrocomplex)
+
+		# Calling the BUILDING FUNCTION. See DOC for its parameters #
+		try:
+			macrocomplex = MacrocomplexBuilder(macrocomplex = macrocomplex, files_list = files_list, it = it, not_added = not_added, command_arguments = command_arguments, structures = structures, spatial_index = spatial_index, interaction_graph = interaction_graph, trajectory = trajectory, metrics = metrics)	#calling the building function
+		finally:
+			if trajectory is not None:
+				trajectory.close()		#waits until all the steps have been written
+				logger.info("Building steps saved in %s and %s" % (os.path.abspath(trajectory.trajectory_path), os.path.abspath(trajectory.transforms_path)))
+
+		metrics.emit()
+		if command_arguments.metrics:
+			metrics.export(os.path.join(outdir, "macrocomplex_metrics.json"), os.path.join(outdir, "macrocomplex_metrics.csv"))
+			logger.info("Metrics saved in %s and %s" % (os.path.join(outdir, "macrocomplex_metrics.json"), os.path.join(outdir, "macrocomplex_metrics.csv")))
+
+		### MACROCOMPLEX BUILDING PROCESS FINISHED ###
+		output_path = Complex_writer(macrocomplex, structures, outdir)		#the atoms of the chains are only placed now, in PDB format if the complex has less than 99,999 atoms and 62 chains, otherwise in MMCIF format
+		logger.info("Output files %s saved in %s" %(os.path.basename(output_path) + " and macrocomplex.log", outdir))
+		checkpoint_path = os.path.join(outdir, "macrocomplex_checkpoint.json")
+		if os.path.exists(checkpoint_path):		#the complex is finished, there is nothing left to resume
+			os.remove(checkpoint_path)
+			logger.info("The checkpoint %s has been removed" % checkpoint_path)
+
+		stop = timeit.default_timer()
+		logger.info("The program has finished running! It took %f seconds" % (stop - start))
+	finally:
+		Job_logger.current.reset(token)
+		for handler in handlers:
+			job_logger.removeHandler(handler)
+			handler.close()
+		job_logger.setLevel(level)
+		job_logger.propagate = propagate
+	return {"macrocomplex": macrocomplex, "output": output_path, "time": stop - start}
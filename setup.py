@@ -8,7 +8,7 @@ setup(name='Macrocomplex Builder',
 	author='Guillermo Palou Marquez and Javier Sanchez Utges',
 	author_email='guillepalou4@gmail.com',
 	long_description=open('README.md').read(),
-	install_requires=['biopython >= 1.73.0','argparse >= 1.1.0'],
+	install_requires=['biopython >= 1.73.0','numpy','argparse >= 1.1.0'],
 	license='LICENSE.txt',
 	url='https://github.com/gpalou4/macrocomplex_builder',
-	scripts=['macrocomplex_builder.py','macrocomplex_functions.py'])
\ No newline at end of file
+	scripts=['macrocomplex_builder.py','macrocomplex_functions.py','macrocomplex_benchmark.py','macrocomplex_batch.py'])
\ No newline at end of file
@@ -0,0 +1,78 @@
+import os
+import io
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy
+import Bio.PDB
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import macrocomplex_functions
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples", "3kuy", "3kuy_AB.pdb")
+
+class Alternate_locations_test(unittest.TestCase):
+	"""The alternate locations of the disordered atoms of the input files are written in the complex, exactly as Bio.PDB.PDBIO writes them"""
+
+	def setUp(self):
+		self.indir = tempfile.mkdtemp()
+		self.outdir = tempfile.mkdtemp()
+		## Gives the first CB atom of the example a second location, B, 1 A away from the first one ##
+		lines = []
+		with open(EXAMPLE) as fh:
+			for line in fh:
+				if line.startswith("ATOM") and line[12:16] == " CB " and not any([other[12:16] == " CB " for other in lines]):
+					lines.append(line[:16] + "A" + line[17:54] + "  0.50" + line[60:])
+					line = line[:16] + "B" + line[17:30] + "%8.3f" % (float(line[30:38]) + 1.0) + line[38:54] + "  0.50" + line[60:]
+				lines.append(line)
+		with open(os.path.join(self.indir, "3kuy_AB.pdb"), "w") as fh:
+			fh.write("".join(lines))
+
+	def tearDown(self):
+		shutil.rmtree(self.indir)
+		shutil.rmtree(self.outdir)
+
+	def Expected_output(self, structure):
+		"""Returns the complex saved by Bio.PDB.PDBIO"""
+		handle = io.StringIO()
+		pdbio = Bio.PDB.PDBIO()
+		pdbio.set_structure(structure)
+		pdbio.save(handle)
+		return handle.getvalue()
+
+	def Written_output(self, macrocomplex, structures):
+		"""Returns the complex saved by Complex_writer"""
+		with open(macrocomplex_functions.Complex_writer(macrocomplex, structures, self.outdir)) as fh:
+			return fh.read()
+
+	def test_initial_complex(self):
+		structures = macrocomplex_functions.Structures_loader(self.indir, ["3kuy_AB.pdb"])
+		macrocomplex = macrocomplex_functions.Complex_initializer(structures, "3kuy_AB.pdb")
+		output = self.Written_output(macrocomplex, structures)
+		self.assertEqual(output, self.Expected_output(Bio.PDB.PDBParser(QUIET = True).get_structure("sample", os.path.join(self.indir, "3kuy_AB.pdb"))))
+		self.assertEqual(len([line for line in output.splitlines() if line.startswith("ATOM") and line[12:17] in (" CB A", " CB B")]), 2)
+
+	def test_transformed_chain(self):
+		structures = macrocomplex_functions.Structures_loader(self.indir, ["3kuy_AB.pdb"])
+		macrocomplex = macrocomplex_functions.Complex_initializer(structures, "3kuy_AB.pdb")
+		rotation = numpy.array([[0.0, -1.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, 1.0]])
+		for record in macrocomplex:
+			record["rotation"], record["translation"] = rotation, numpy.array([10.0, -5.0, 2.5])
+		output = self.Written_output(macrocomplex, structures)
+		self.assertEqual(output, self.Expected_output(macrocomplex_functions.Complex_materializer(macrocomplex, structures)))
+		self.assertEqual(len([line for line in output.splitlines() if line.startswith("ATOM") and line[12:17] in (" CB A", " CB B")]), 2)
+
+	def test_cached_structures(self):
+		cache_dir = os.path.join(self.outdir, "cache")
+		os.mkdir(cache_dir)
+		outputs, parsed = [], []
+		for run in range(2):		#the first run saves the structures in the cache, the second one loads them from it
+			structures = macrocomplex_functions.Structures_loader(self.indir, ["3kuy_AB.pdb"], cache_dir)
+			parsed.append(structures["3kuy_AB.pdb"]["structure"] is not None)
+			outputs.append(self.Written_output(macrocomplex_functions.Complex_initializer(structures, "3kuy_AB.pdb"), structures))
+		self.assertEqual(parsed, [True, False])
+		self.assertEqual(outputs[0], outputs[1])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import macrocomplex_functions
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "examples")
+
+class Job_logs_test(unittest.TestCase):
+	"""Two jobs run at the same time in different threads of a program write each one its own log, without the messages of the other one"""
+
+	def setUp(self):
+		self.outdir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.outdir)
+
+	def test_concurrent_jobs(self):
+		jobs = {"3kuy": 10, "6ezm": 24}
+		errors = []
+		def Run(example, number_chains):
+			try:
+				macrocomplex_functions.Macrocomplex_job(argparse.Namespace(indir = os.path.join(EXAMPLES, example), outdir = os.path.join(self.outdir, example), number_chains = number_chains))
+			except Exception as error:
+				errors.append(error)
+		threads = []
+		for example, number_chains in jobs.items():
+			os.mkdir(os.path.join(self.outdir, example))
+			threads.append(threading.Thread(target = Run, args = (example, number_chains)))
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(errors, [])
+		for example in jobs:
+			with open(os.path.join(self.outdir, example, "macrocomplex.log")) as fh:
+				log = fh.read()
+			self.assertEqual(log.count("The program has finished running!"), 1)
+			processed = [line for line in log.splitlines() if "We are processing the file" in line]
+			self.assertTrue(processed)
+			self.assertTrue(set([line.split()[-1] for line in processed]) <= set(os.listdir(os.path.join(EXAMPLES, example))))
+
+if __name__ == "__main__":
+	unittest.main()